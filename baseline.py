@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+from feature_engineering import CategoricalEncoder
+from forecast import MODEL_DIRECTORY, MODEL_VARIANTS, ForecastEngine
+
+
+def per_room_split(df, test_share:float = 0.2, date_time_column:str = "date_time"):
+    """
+    Train/test split of the forecasters: the last test_share of the rows of every room (in time order) are test data.
+
+    Parameters:
+    df (pd.DataFrame): Feature data with a room_number column.
+    test_share (float): Share of the rows of every room used for testing.
+    date_time_column (str): Column with the timestamps.
+
+    Returns:
+    np.ndarray: Boolean mask of the test rows, aligned with the rows of df.
+    """
+    room_codes = pd.factorize(df["room_number"])[0]
+    order = np.lexsort((df[date_time_column].to_numpy(), room_codes))
+    room_sizes = np.bincount(room_codes)
+    room_starts = np.concatenate([[0], np.cumsum(room_sizes)[:-1]])
+    sorted_codes = room_codes[order]
+    position = np.arange(len(order)) - room_starts[sorted_codes]
+    is_test = np.empty(len(order), dtype=bool)
+    is_test[order] = position >= room_sizes[sorted_codes] - np.ceil(room_sizes[sorted_codes] * test_share)
+    return is_test
+
+
+def baseline_features(df, target:str = "tmp+1", exclude = ("room_number",)):
+    """
+    Input columns of the baseline: all numeric and boolean columns except the target and other leads of the target
+    (e.g. lags, cyclical encodings, one-hot columns and weather), plus the categorical columns (e.g. season).
+
+    Returns:
+    tuple: Numeric columns and categorical columns.
+    """
+    lead_prefix = target.split("+")[0] + "+"
+    numeric, categorical = [], []
+    for col, dtype in df.dtypes.items():
+        if col in exclude or col == target or str(col).startswith(lead_prefix):
+            continue
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+            numeric.append(col)
+        elif isinstance(dtype, pd.CategoricalDtype):
+            categorical.append(col)
+    return numeric, categorical
+
+
+class RidgeBaseline:
+    """
+    Linear autoregressive baseline fitted in closed form with ridge regularization, either one model for all rooms
+    or one model per room (rooms without training rows use the global model).
+    """
+    def __init__(self, alpha:float = 1.0, per_room:bool = False):
+        """
+        Parameters:
+        alpha (float): Regularization strength on the standardized features.
+        per_room (bool): Fit one model per room in addition to the global model.
+        """
+        self.alpha = alpha
+        self.per_room = per_room
+        self.rooms = []
+        self.room_weights = None
+        self.room_intercepts = None
+
+    def _solve(self, z, y):
+        """
+        Ridge solution of the normal equations with an unpenalized intercept.
+        """
+        z_mean, y_mean = z.mean(axis=0), y.mean()
+        centered = z - z_mean
+        gram = centered.T @ centered + self.alpha * np.eye(z.shape[1])
+        weights = np.linalg.solve(gram, centered.T @ (y - y_mean))
+        return weights, y_mean - z_mean @ weights
+
+    def fit(self, x, y, rooms = None):
+        """
+        Parameters:
+        x (np.ndarray): Features of shape (rows, features).
+        y (np.ndarray): Target values.
+        rooms (array-like): Room number of every row, needed for per_room.
+
+        Returns:
+        RidgeBaseline: The fitted model.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.mean = x.mean(axis=0)
+        scale = x.std(axis=0)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        z = (x - self.mean) / self.scale
+        self.weights, self.intercept = self._solve(z, y)
+        if self.per_room:
+            room_codes, rooms = pd.factorize(np.asarray(rooms))
+            self.rooms = list(rooms)
+            order = np.argsort(room_codes, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(room_codes, minlength=len(rooms)))])
+            solutions = [self._solve(z[order[start:stop]], y[order[start:stop]]) for start, stop in zip(bounds[:-1], bounds[1:])]
+            self.room_weights = np.stack([weights for weights, _ in solutions])
+            self.room_intercepts = np.array([intercept for _, intercept in solutions])
+        return self
+
+    def predict(self, x, rooms = None):
+        """
+        Parameters:
+        x (np.ndarray): Features of shape (rows, features).
+        rooms (array-like): Room number of every row, used by per-room models.
+
+        Returns:
+        np.ndarray: Predictions.
+        """
+        z = (np.asarray(x, dtype=np.float64) - self.mean) / self.scale
+        if not self.per_room or rooms is None:
+            return z @ self.weights + self.intercept
+        # models of unknown rooms fall back to the global model, stored after the room models
+        weights = np.vstack([self.room_weights, self.weights])
+        intercepts = np.append(self.room_intercepts, self.intercept)
+        codes = pd.Index(self.rooms).get_indexer(np.asarray(rooms))
+        codes[codes < 0] = len(self.rooms)
+        return np.einsum("ij,ij->i", z, weights[codes]) + intercepts[codes]
+
+
+def load_losses(path:str):
+    """
+    Read a *_losses.txt file of the trained models.
+
+    Returns:
+    dict: Lists of the 'train' and 'test' losses per epoch.
+    """
+    losses = {"train": [], "test": []}
+    section = None
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line.endswith("Losses:"):
+                section = line.split()[0].lower()
+            elif line and section is not None:
+                losses[section].append(float(line))
+    return losses
+
+
+def lstm_results(model_directory:str = MODEL_DIRECTORY):
+    """
+    Results of the trained BiLSTMs from their loss files: final train and test loss (MSE) and the best test loss.
+    These were computed on the data of the notebooks, so they are only comparable with the baselines if no data is scored.
+    """
+    records = []
+    for variant, name in MODEL_VARIANTS.items():
+        path = os.path.join(model_directory, f"{variant}_losses.txt")
+        if not os.path.exists(path):
+            continue
+        losses = load_losses(path)
+        records.append({"model": f"BiLSTM {name}", "log_train_mse": losses["train"][-1], "log_test_mse": losses["test"][-1],
+                        "log_best_test_mse": min(losses["test"]), "epochs": len(losses["train"])})
+    return pd.DataFrame(records)
+
+
+def score_lstms(df, feature_columns:dict, is_test, target:str = "tmp+1", model_directory:str = MODEL_DIRECTORY, batch_size:int = 4096):
+    """
+    Score the BiLSTMs on the rows of the baseline split. Every row is one input window of the ForecastEngine (lag 1,
+    the lags are columns), its label is the target column, i.e. the value of the next row.
+
+    Parameters:
+    df (pd.DataFrame): Feature data with the input columns of the variants and the target.
+    feature_columns (dict): Input columns per variant (checkpoint number or name), in model order.
+    is_test (np.ndarray): Test mask of per_room_split.
+    target (str): Column with the next value of the forecast column.
+    model_directory (str): Directory with the checkpoints.
+    batch_size (int): Rows per forward pass.
+
+    Returns:
+    pd.DataFrame: Train and test MSE and test MAE per variant.
+    """
+    engine = ForecastEngine(feature_columns, model_directory)
+    y = df[target].to_numpy(dtype=np.float64)
+    records = []
+    with torch.inference_mode():
+        for variant, columns in engine.feature_columns.items():
+            model = engine.model(variant)
+            inputs = torch.from_numpy(df[columns].to_numpy(dtype=np.float32))[:, None, :]
+            predictions = torch.cat([model(batch) for batch in torch.split(inputs, batch_size)])[:, 0].double().numpy()
+            error = predictions - y
+            records.append({"model": f"BiLSTM {MODEL_VARIANTS.get(variant, variant)}", "train_mse": np.mean(error[~is_test] ** 2),
+                            "test_mse": np.mean(error[is_test] ** 2), "test_mae": np.mean(np.abs(error[is_test]))})
+    return pd.DataFrame(records)
+
+
+def evaluate_baselines(df, target:str = "tmp+1", alphas = (1.0,), test_share:float = 0.2, model_directory:str = MODEL_DIRECTORY,
+                       feature_columns:dict = None):
+    """
+    Fit the global and per-room ridge baselines on the per-room train split and report them next to the BiLSTMs,
+    which are scored on the same test rows.
+
+    Parameters:
+    df (pd.DataFrame): Output of FeatureEngineering.feature_engineering with a lead of the target (e.g. leads=1 for 'tmp+1').
+    target (str): Column that is forecast.
+    alphas (tuple): Regularization strengths to evaluate.
+    test_share (float): Share of the rows of every room used for testing.
+    model_directory (str): Directory with the checkpoints and *_losses.txt files of the BiLSTMs.
+    feature_columns (dict): Input columns per BiLSTM variant. Variants without columns are only reported
+                            with the losses of their training logs (log_* columns).
+
+    Returns:
+    pd.DataFrame: Train and test MSE, test MAE and fit time per model, and the logged losses of the BiLSTMs.
+    """
+    df = df.dropna(subset=[target])
+    numeric, categorical = baseline_features(df, target)
+    x = df[numeric].to_numpy(dtype=np.float64)
+    if categorical:
+        x = np.hstack([x, CategoricalEncoder(categorical).fit(df).transform(df, output="dense").to_numpy(dtype=np.float64)])
+    x = np.nan_to_num(x)
+    y = df[target].to_numpy(dtype=np.float64)
+    rooms = df["room_number"].to_numpy()
+    is_test = per_room_split(df, test_share)
+
+    records = []
+    for alpha in alphas:
+        for per_room in (False, True):
+            start = time.perf_counter()
+            model = RidgeBaseline(alpha, per_room).fit(x[~is_test], y[~is_test], rooms[~is_test])
+            fit_time = time.perf_counter() - start
+            train_error = model.predict(x[~is_test], rooms[~is_test]) - y[~is_test]
+            test_error = model.predict(x[is_test], rooms[is_test]) - y[is_test]
+            records.append({"model": f"Ridge {'per room' if per_room else 'global'} (alpha={alpha:g})",
+                            "train_mse": np.mean(train_error ** 2), "test_mse": np.mean(test_error ** 2),
+                            "test_mae": np.mean(np.abs(test_error)), "fit_s": fit_time})
+    lstms = lstm_results(model_directory)
+    if feature_columns:
+        scores = score_lstms(df, feature_columns, is_test, target, model_directory)
+        # variant order of the loss files, scored variants without a loss file are appended
+        if len(lstms):
+            lstms = pd.concat([lstms.merge(scores, on="model", how="left"), scores[~scores.model.isin(lstms.model)]])
+        else:
+            lstms = scores
+    return pd.concat([pd.DataFrame(records), lstms], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ridge baselines compared with the BiLSTM forecasters.")
+    parser.add_argument("data", help="Feature data (.parquet, .pkl or .csv) from FeatureEngineering.feature_engineering with leads=1.")
+    parser.add_argument("--target", default="tmp+1")
+    parser.add_argument("--alphas", nargs="+", type=float, default=[1.0])
+    parser.add_argument("--features", default=None, help="JSON file with the input columns per BiLSTM variant, e.g. {\"0\": [...]}; "
+                                                         "without it only the logged BiLSTM losses are reported.")
+    args = parser.parse_args()
+
+    if args.data.endswith(".parquet"):
+        data = pd.read_parquet(args.data)
+    elif args.data.endswith(".pkl"):
+        data = pd.read_pickle(args.data)
+    else:
+        data = pd.read_csv(args.data, parse_dates=["date_time"])
+    feature_columns = None
+    if args.features is not None:
+        with open(args.features) as file:
+            feature_columns = {int(key) if key.isdigit() else key: columns for key, columns in json.load(file).items()}
+    results = evaluate_baselines(data, args.target, args.alphas, feature_columns=feature_columns)
+    print(results.to_string(index=False, float_format="{:.4f}".format))
+    print("log_* columns are the BiLSTM losses of the training logs in trained_models, computed on the data of the notebooks.")
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import dashboard_functions
+from preprocessing import DataExtractor, DataPreprocessing
+from feature_engineering import FeatureEngineering
+from synthetic_data import write_dataset
+from partition_index import PartitionIndex
+
+# Sizes of the synthetic building relative to the current E-building (about 40 CO2-Ampeln)
+SCALES = {"small": {"n_rooms": 5, "months": 1},
+          "1x": {"n_rooms": 40, "months": 3},
+          "10x": {"n_rooms": 400, "months": 3},
+          "100x": {"n_rooms": 4000, "months": 3}}
+
+
+def make_sensor_frame(n_rooms:int, days:int = 14, freq:str = "5min", seed:int = 0):
+    """
+    Create a synthetic CO2-Ampel frame in the shape DataPreprocessing.create_rolling_windows expects
+    (after room extraction and validation).
+
+    Parameters:
+    n_rooms (int): Number of rooms.
+    days (int): Number of days per room.
+    freq (str): Sampling interval of the sensors.
+    seed (int): Seed of the random generator.
+
+    Returns:
+    pd.DataFrame: Sensor readings of all rooms, interleaved in time order.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2023-01-02", periods=int(pd.Timedelta(days=days) / pd.Timedelta(freq)), freq=freq)
+    rooms = np.array([f"e{floor}{room:02d}" for floor in range(4) for room in range(1, 100)][:n_rooms])
+    n = len(times) * len(rooms)
+    df = pd.DataFrame({
+        "date_time": np.repeat(times, len(rooms)) + pd.to_timedelta(rng.integers(0, 60, n), unit="s"),
+        "tmp": rng.normal(22, 1.5, n),
+        "hum": rng.normal(40, 5, n),
+        "CO2": rng.normal(700, 150, n),
+        "VOC": rng.normal(500, 80, n),
+        "vis": rng.integers(0, 300, n).astype(float),
+        "IR": rng.integers(0, 50, n).astype(float),
+        "BLE": rng.integers(0, 10, n).astype(float),
+        "WIFI": rng.integers(0, 10, n).astype(float),
+        "rssi": rng.integers(-110, -60, n).astype(float),
+        "snr": rng.normal(5, 2, n),
+        "room_number": np.tile(rooms, len(times)),
+    })
+    df["building_name"] = "e"
+    return df
+
+
+def legacy_create_rolling_windows(preprocessing, df, rolling_window, sample_time="60min"):
+    """
+    Reference implementation of DataPreprocessing.create_rolling_windows with one boolean mask,
+    resample and join per room. Only used to benchmark the grouped implementation against.
+    """
+    df_sorted = df.sort_values(preprocessing.date_time_column)
+    all_results = list()
+    for room in df.room_number.unique():
+        room_df = df_sorted[df_sorted.room_number == room]
+        numerical_features = ["tmp","hum","CO2","VOC","vis","IR", "BLE", 'rssi', "snr"]
+        room_df = room_df.set_index(preprocessing.date_time_column)
+        room_df_resampled = room_df[numerical_features].resample(sample_time).mean()
+        room_df_rolled = room_df_resampled.rolling(rolling_window).mean()
+        non_numerical_df = room_df.select_dtypes(exclude=['number']).resample(sample_time).first()
+        result = room_df_rolled.join(non_numerical_df)
+        result.loc[:, "room_number"] = room
+        all_results.append(result)
+    all_results_df = pd.concat([result_df for result_df in all_results if not result_df.empty])
+    return preprocessing.drop_na_rows(all_results_df)
+
+
+def time_call(func, *args, repeat:int = 3, **kwargs):
+    """
+    Run a function several times and return the fastest wall time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_rolling_windows(room_counts=(10, 50, 100, 200), days:int = 14, rolling_window:str = "60min", sample_time:str = "60min", repeat:int = 3):
+    """
+    Compare the per-room loop with the grouped create_rolling_windows for a growing number of rooms.
+
+    Parameters:
+    room_counts (tuple of int): Number of rooms per benchmark run.
+    days (int): Number of days of 5 minute readings per room.
+    rolling_window (str): Size of the rolling window.
+    sample_time (str): Resampling interval.
+    repeat (int): Number of repetitions, the fastest one is reported.
+
+    Returns:
+    pd.DataFrame: Rows, timings and speedup per room count.
+    """
+    preprocessing = DataPreprocessing(get_outliers_out=False, roll=True)
+    results = []
+    for n_rooms in room_counts:
+        df = make_sensor_frame(n_rooms, days=days)
+        legacy = time_call(legacy_create_rolling_windows, preprocessing, df, rolling_window, sample_time, repeat=repeat)
+        grouped = time_call(preprocessing.create_rolling_windows, df, rolling_window, sample_time=sample_time, repeat=repeat)
+        results.append({"rooms": n_rooms, "rows": df.shape[0], "legacy_s": legacy, "grouped_s": grouped, "speedup": legacy / grouped})
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False, float_format="{:.3f}".format))
+    return results
+
+
+def benchmark_seasons(sizes=(10000, 100000, 500000), repeat:int = 3):
+    """
+    Compare the row-wise FeatureEngineering.get_season (Series.apply) with the vectorized add_season_column on hourly timestamps.
+
+    Parameters:
+    sizes (tuple of int): Number of hourly timestamps per benchmark run.
+    repeat (int): Number of repetitions, the fastest one is reported.
+
+    Returns:
+    pd.DataFrame: Timings and speedup per size.
+    """
+    results = []
+    for size in sizes:
+        feature_engineering = FeatureEngineering(pd.DataFrame({"date_time": pd.date_range("2022-01-01", periods=size, freq="h")}))
+        dates = feature_engineering.df["date_time"]
+        # the row-wise path is slow, it runs once
+        start = time.perf_counter()
+        seasons = dates.apply(feature_engineering.get_season)
+        apply = time.perf_counter() - start
+        vectorized = time_call(feature_engineering.add_season_column, repeat=repeat)
+        assert (seasons == feature_engineering.df["season"].astype(str)).all()
+        results.append({"rows": size, "apply_s": apply, "vectorized_s": vectorized, "speedup": apply / vectorized})
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False, float_format="{:.4f}".format))
+    return results
+
+
+def dashboard_frames(df):
+    """
+    Derive the inputs of the dashboard figures from preprocessed data, in the layout of the CSV files in 'Dashboard Data'.
+    The predictions are the true values plus noise, since only the figure builders are benchmarked.
+    season_data and df_vanilla are returned as PartitionIndex objects, as in dashboard.py.
+    """
+    rng = np.random.default_rng(0)
+    df_hourly = df.groupby(pd.Grouper(key="date_time", freq="h"))[["tmp", "hum", "CO2", "VOC"]].mean().reset_index()
+    room_value_counts = df.room_number.astype(str).value_counts().rename("datapoints").rename_axis("room_number").to_frame()
+    df_ampel = pd.crosstab(df.room_number.astype(str), df.color.astype(str)).reindex(columns=["green", "red", "red_blinking", "yellow"], fill_value=0)
+    df_ampel["count"] = df_ampel.sum(axis=1)
+    for color in ["red_blinking", "red"]:
+        df_ampel[f"{color}_rate"] = df_ampel[color] / df_ampel["count"]
+    df_ampel["red_yellow_rate"] = (df_ampel["red"] + df_ampel["yellow"]) / df_ampel["count"]
+    df_ampel = df_ampel.reset_index()
+    df_vanilla = df[["date_time", "room_number", "tmp"]].assign(room_number=df.room_number.astype(str))
+    # the last 20% of every room are the test data of the forecast
+    position = df_vanilla.groupby("room_number").cumcount()
+    room_size = df_vanilla.groupby("room_number").room_number.transform("size")
+    season_data = df_vanilla[position >= (room_size * 0.8 + 1).astype(int)]
+    season_data = season_data.rename(columns={"tmp": "Vanilla True Values"}).reset_index(drop=True)
+    for variant in ["Vanilla", "Seasons", "Weather", "Combined"]:
+        season_data[f"{variant} True Values"] = season_data["Vanilla True Values"]
+        season_data[f"{variant} Predictions"] = season_data["Vanilla True Values"] + rng.normal(0, 0.3, season_data.shape[0])
+    season_data["Etage"] = np.where(season_data.room_number.str.startswith("eu"), "Etage EU", "Etage " + season_data.room_number.str[1])
+    return df_hourly, room_value_counts, df_ampel, PartitionIndex(season_data, floor_column="Etage"), PartitionIndex(df_vanilla)
+
+
+def build_dashboard_figures(df_hourly, room_value_counts, df_ampel, season_data, df_vanilla):
+    """
+    Build all figures of both dashboard pages for the first room, as on the start of the dashboard.
+    """
+    room = season_data.rooms[0]
+    floor = season_data.floor_of(room)
+    for metric in ["CO2", "VOC", "Temperature", "Humidity"]:
+        dashboard_functions.seite1_figure1(df_hourly, metric)
+    dashboard_functions.seite1_figure2(room_value_counts)
+    dashboard_functions.seite1_figure3(df_ampel)
+    dashboard_functions.seite2_figure1(season_data, df_vanilla, room)
+    dashboard_functions.seite2_figure2(season_data, ["Everything"], floor, room)
+
+
+def git_revision():
+    """
+    Short hash of the checked out commit, None outside of a git repository.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_pipeline(scales=("small", "1x"), archive:str = None, rolling_window:str = "60min", sample_time:str = "60min",
+                       n_jobs:int = 1, lags:int = 2, history_path:str = "benchmark_history.jsonl", seed:int = 0):
+    """
+    Time DataExtractor, DataPreprocessing, FeatureEngineering and the dashboard figure builders on synthetic data
+    of growing size. Every run is appended to a JSON lines history file and compared with the previous run of the same scale.
+
+    Parameters:
+    scales (tuple of str or dict): Names from SCALES or dicts with the arguments of synthetic_data.write_dataset.
+    archive (str): None, "zip" or "tar", packing of the synthetic .dat files.
+    rolling_window (str): Size of the rolling window.
+    sample_time (str): Resampling interval.
+    n_jobs (int): Number of processes for reading and preprocessing. With 1 the files are streamed from the archives,
+                  with more processes they are extracted and read in parallel (DataExtractor.get_data_parallel).
+    lags (int): Number of lags in FeatureEngineering.feature_engineering.
+    history_path (str): JSON lines file with the results of all runs, None to keep no history.
+    seed (int): Seed of the synthetic data.
+
+    Returns:
+    pd.DataFrame: Rows and timings per scale.
+    """
+    history = load_history(history_path)
+    revision = git_revision()
+    extract_mode = "stream" if n_jobs in (None, 1) else "parallel"
+    results = []
+    for scale in scales:
+        config = SCALES[scale] if isinstance(scale, str) else scale
+        label = scale if isinstance(scale, str) else ",".join(f"{k}={v}" for k, v in config.items())
+        with tempfile.TemporaryDirectory() as directory:
+            summary = write_dataset(directory, archive=archive, seed=seed, **config)
+            start = time.perf_counter()
+            # the stream mode reads serially, with several processes the archives are extracted and read by get_data_parallel
+            raw = DataExtractor(directory, directory, stream=extract_mode == "stream", n_jobs=n_jobs).create_df()
+            extract = time.perf_counter() - start
+        start = time.perf_counter()
+        df = DataPreprocessing(n_jobs=n_jobs, random_state=seed).preprocess_df(raw, rolling_window=rolling_window, sample_time=sample_time)
+        preprocess = time.perf_counter() - start
+        frames = dashboard_frames(df)
+        start = time.perf_counter()
+        FeatureEngineering(df.copy()).feature_engineering(lags)
+        feature_engineering = time.perf_counter() - start
+        start = time.perf_counter()
+        build_dashboard_figures(*frames)
+        dashboard = time.perf_counter() - start
+        results.append({"created": datetime.now().isoformat(timespec="seconds"), "revision": revision, "scale": label,
+                        "archive": archive, "n_jobs": n_jobs, "extract_mode": extract_mode, "files": summary["files"],
+                        "raw_rows": raw.shape[0],
+                        "rows": df.shape[0], "extract_s": extract, "preprocess_s": preprocess,
+                        "feature_engineering_s": feature_engineering, "dashboard_s": dashboard,
+                        "total_s": extract + preprocess + feature_engineering + dashboard})
+    results = pd.DataFrame(results)
+    print(results.drop(columns=["created", "revision"]).to_string(index=False, float_format="{:.3f}".format))
+    compare_with_history(results, history)
+    if history_path is not None:
+        with open(history_path, "a") as file:
+            for record in results.to_dict(orient="records"):
+                file.write(json.dumps(record) + "\n")
+    return results
+
+
+def load_history(history_path:str):
+    """
+    Read the results of earlier benchmark runs.
+    """
+    if history_path is None or not os.path.exists(history_path):
+        return pd.DataFrame()
+    return pd.read_json(history_path, lines=True)
+
+
+def compare_with_history(results, history):
+    """
+    Print the change of the timings relative to the last earlier run with the same scale and settings.
+    """
+    if history.empty:
+        return
+    keys = ["scale", "archive", "n_jobs", "extract_mode"]
+    # runs before the extract mode was recorded always streamed the files
+    history = history.assign(extract_mode=history["extract_mode"].fillna("stream") if "extract_mode" in history.columns else "stream")
+    timings = [col for col in results.columns if col.endswith("_s")]
+    previous = history.drop_duplicates(subset=keys, keep="last").set_index(keys)
+    for record in results.itertuples(index=False):
+        key = tuple(getattr(record, col) for col in keys)
+        if key not in previous.index:
+            continue
+        last = previous.loc[key]
+        changes = ", ".join(f"{col} {getattr(record, col) / last[col] - 1:+.0%}" for col in timings if last[col] > 0)
+        print(f"{record.scale} vs. {last.revision or 'previous run'} ({last.created}): {changes}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks of the CO2-Ampel pipeline on synthetic data.")
+    parser.add_argument("--scales", nargs="+", default=["small", "1x"], choices=list(SCALES))
+    parser.add_argument("--archive", choices=["zip", "tar"], default=None)
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--history", default="benchmark_history.jsonl")
+    parser.add_argument("--rolling-windows", action="store_true", help="only compare the rolling window implementations")
+    parser.add_argument("--seasons", action="store_true", help="only compare the season assignment implementations")
+    args = parser.parse_args()
+    if args.rolling_windows:
+        benchmark_rolling_windows()
+    elif args.seasons:
+        benchmark_seasons()
+    else:
+        benchmark_pipeline(scales=args.scales, archive=args.archive, n_jobs=args.n_jobs, history_path=args.history)
@@ -1,6 +1,7 @@
 from dash import Dash, html, dcc, Input, Output, callback
 import pandas as pd
 from dashboard_functions import *
+from partition_index import PartitionIndex
 
 # Daten - Seite 1
 df_hourly = pd.read_csv(r'Dashboard_Data\dashboard_hourly_data.csv',parse_dates=['date_time'])
@@ -12,6 +13,10 @@ season_data = pd.read_csv(r'Dashboard_Data\dashboard_season_data.csv',parse_date
 
 df_vanilla = pd.read_csv(r'Dashboard_Data\dashboard_df_vanilla.csv',parse_dates=['date_time'])
 
+# Einmal nach Etage, Raum und Zeit sortieren, damit die Callbacks Räume und Etagen ohne Maske über alle Zeilen abfragen
+season_index = PartitionIndex(season_data, floor_column='Etage')
+vanilla_index = PartitionIndex(df_vanilla)
+
 
 # Figures - Seite 1
 # Figure 1
@@ -30,12 +35,12 @@ last_selected_floor_seite2 = 'Etage EU'
 last_selected_room_seite2 = 'eu02'
 
 # Figure 1
-seite2_fig1 = seite2_figure1(season_data,df_vanilla,last_selected_room_seite2)
+seite2_fig1 = seite2_figure1(season_index,vanilla_index,last_selected_room_seite2)
 
 
 # Figure 2
 
-seite2_fig2 = seite2_figure2(season_data,['Everything'],last_selected_floor_seite2,last_selected_room_seite2)
+seite2_fig2 = seite2_figure2(season_index,['Everything'],last_selected_floor_seite2,last_selected_room_seite2)
 
 # Dashboard App erstellen
 app = Dash(__name__)
@@ -89,7 +94,7 @@ app.layout = html.Div([
     html.Br(),
         dcc.Dropdown(
         id='rooms_dropdown',
-        options=[room_choice for room_choice in season_data[season_data['Etage'] == last_selected_room_seite2]['room_number'].unique()],
+        options=season_index.rooms_of(floor=last_selected_floor_seite2),
         value=last_selected_room_seite2
     ),
             html.Br(),
@@ -139,9 +144,7 @@ def update_graph_seite1_fig1(metric):
 )
 def update_dropdowns_seite2(floor,room):
     
-    bedingung1 = season_data['Etage'] == floor
-    
-    options=[room_choice for room_choice in season_data[bedingung1]['room_number'].unique()]
+    options=season_index.rooms_of(floor=floor)
 
     if last_selected_floor_seite2 != floor:
         room = options[0]
@@ -164,7 +167,7 @@ def update_graph_seite2_fig1(floor,room):
         room = last_selected_room_seite2
 
 
-    fig = seite2_figure1(season_data,df_vanilla,room)
+    fig = seite2_figure1(season_index,vanilla_index,room)
 
     return fig
 
@@ -187,7 +190,7 @@ def update_graph_seite2_fig2(views,floor,room):
     last_selected_floor_seite2 = floor
     last_selected_room_seite2 = room 
 
-    fig = seite2_figure2(season_data,views,floor,room)
+    fig = seite2_figure2(season_index,views,floor,room)
 
     return fig
 
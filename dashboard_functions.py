@@ -1,7 +1,17 @@
 import pandas as pd
 import plotly.graph_objects as go
+from partition_index import PartitionIndex
 
-# Annahme: season_data und df_vanilla sind bereits definierte DataFrames
+# Annahme: season_data und df_vanilla sind bereits definierte DataFrames oder PartitionIndex-Objekte
+
+def select_rows(data, room, floor=None):
+    # Zeilen eines Raumes (optional nur, wenn er auf der Etage liegt). Ein PartitionIndex liefert sie ohne Maske über alle Zeilen.
+    if isinstance(data, PartitionIndex):
+        return data.select(room=room, floor=floor)
+    bedingung = data['room_number'] == room
+    if floor is not None:
+        bedingung &= data['Etage'] == floor
+    return data[bedingung]
 
 def seite1_figure1(df_hourly,metric):
 
@@ -75,8 +85,8 @@ def seite1_figure3(dataframe):
 
 def seite2_figure1(season_data, df_vanilla, room):
     # Filterdaten basierend auf dem Raum
-    data1 = season_data[season_data['room_number'] == room][["Vanilla Predictions",'date_time']].copy()
-    data2 = df_vanilla[df_vanilla['room_number'] == room][["tmp",'date_time']].copy()
+    data1 = select_rows(season_data, room)[["Vanilla Predictions",'date_time']].copy()
+    data2 = select_rows(df_vanilla, room)[["tmp",'date_time']].copy()
 
     # Erstellen der Trainings- und Vorhersage-Datenframes
     test_len = int(len(data2) * 0.8 + 1)
@@ -120,9 +130,7 @@ def seite2_figure1(season_data, df_vanilla, room):
     return fig
 
 def seite2_figure2(season_data, views, floor, room):
-    bedingung1 = season_data['Etage'] == floor
-    bedingung2 = season_data['room_number'] == room
-    data = season_data[bedingung1 & bedingung2].copy().reset_index(drop=True)
+    data = select_rows(season_data, room, floor).copy().reset_index(drop=True)
 
     fig = go.Figure()
 
@@ -1,47 +1,151 @@
+import os
+import json
 import pandas as pd
 import numpy as np
-from datetime import datetime
+import joblib
+from scipy import sparse
 from meteostat import Point, Hourly
 from sklearn.preprocessing import OneHotEncoder
+from schema import DTYPE_SCHEMA, SEASON_CATEGORIES, apply_schema
+from profiling import run_step
+from partition_index import PartitionIndex
+
+# First day (month, day) of every season. Astronomical boundaries are the fixed dates used so far, meteorological seasons start on the first of the month.
+SEASON_BOUNDARIES = {
+    "astronomical": {"spring": (3, 21), "summer": (6, 21), "autumn": (9, 23), "winter": (12, 21)},
+    "meteorological": {"spring": (3, 1), "summer": (6, 1), "autumn": (9, 1), "winter": (12, 1)},
+}
+
+
+# Columns added by FeatureEngineering.cyclical_encoding
+CYCLICAL_FEATURES = ['hour_sin', 'hour_cos', 'day_of_week_sin', 'day_of_week_cos', 'month_sin', 'month_cos']
+
+
+def cyclical_values(hour, dayofweek, month):
+    """
+    Sine and cosine encoding of hour of the day, day of the week and month, so that e.g. hour 23 is next to hour 0.
+
+    Parameters:
+    hour, dayofweek, month: Arrays or Series of the time components.
+
+    Returns:
+    dict: Values of the CYCLICAL_FEATURES columns.
+    """
+    return {
+        'hour_sin': np.sin(2 * np.pi * hour / 24),
+        'hour_cos': np.cos(2 * np.pi * hour / 24),
+        'day_of_week_sin': np.sin(2 * np.pi * dayofweek / 7),
+        'day_of_week_cos': np.cos(2 * np.pi * dayofweek / 7),
+        'month_sin': np.sin(2 * np.pi * month / 12),
+        'month_cos': np.cos(2 * np.pi * month / 12),
+    }
+
+
+def season_lookup_table(boundaries="astronomical"):
+    """
+    Build a lookup table of season codes (positions in SEASON_CATEGORIES) indexed by [month, day].
+
+    Parameters:
+    boundaries (str or dict): Name of an entry of SEASON_BOUNDARIES or a dict with the first (month, day) of every season.
+
+    Returns:
+    np.ndarray: int8 array of shape (13, 32). Row 0 and column 0 are unused.
+    """
+    starts = SEASON_BOUNDARIES[boundaries] if isinstance(boundaries, str) else boundaries
+    starts = sorted((month * 100 + day, SEASON_CATEGORIES.index(season)) for season, (month, day) in starts.items())
+    month_day = np.arange(13)[:, None] * 100 + np.arange(32)[None, :]
+    # index of the last season that started on or before the date; dates before the first start belong to the
+    # season that started in the previous year (e.g. January to March in winter)
+    position = np.searchsorted([start for start, _ in starts], month_day, side="right") - 1
+    codes = np.array([code for _, code in starts], dtype=np.int8)
+    return codes[position]
 
 
 
 class FeatureEngineering:
-    def __init__(self, df):
-        self.df = df
+    def __init__(self, df, profiler=None, diff_features=None):
+        """
+        Parameters:
+        df (pd.DataFrame): The preprocessed data.
+        profiler (profiling.StepProfiler): Records wall time, rows and memory of each step of feature_engineering. None disables it.
+        diff_features (list): The diff_features of DataPreprocessing, whose <feature>_diff_per_sec columns are dropped by
+                              delete_columns. Default: all features with a <feature>_diff_per_sec column in df.
+        """
+        # Compact dtypes (float32, small integers, categoricals) from the central schema, converted in place
+        self.df = apply_schema(df, inplace=True, verbose=True, label="Feature data")
         self.filtered_dataframes = None
+        self.partition_index = None
+        self.profiler = profiler
+        if diff_features is None:
+            diff_features = [col[:-len('_diff_per_sec')] for col in self.df.columns if str(col).endswith('_diff_per_sec')]
+        self.diff_features = list(diff_features)
 
-    def feature_engineering(self, n):
+    def feature_engineering(self, n, lag_features=None, leads=0):
         """
         Overall method to perform feature engineering.
 
+        Parameters:
+        n (int): Number of lags.
+        lag_features (list): Features to create lags for, default ['tmp'].
+        leads (int): Number of leads (future values) for multi-step targets.
         """
-        self.add_season_column()
-        self.create_shifts(n)
-        self.cyclical_encoding()
-        self.delete_columns()
+        frame = lambda: self.df
+        run_step(self.profiler, self.add_season_column, frame=frame)
+        run_step(self.profiler, self.create_shifts, n, features=lag_features, leads=leads, frame=frame)
+        run_step(self.profiler, self.cyclical_encoding, frame=frame)
+        run_step(self.profiler, self.delete_columns, frame=frame)
 
-        return self.df.dropna()
+        return run_step(self.profiler, pd.DataFrame.dropna, self.df)
 
     def cyclical_encoding(self):
-        # Cyclical encoding for hour of the day
-        self.df['hour_sin'] = np.sin(2 * np.pi * self.df['hour'] / 24)
-        self.df['hour_cos'] = np.cos(2 * np.pi * self.df['hour'] / 24)
-
-        # Cyclical encoding for day of the week
-        self.df['day_of_week_sin'] = np.sin(2 * np.pi * self.df['dayofweek'] / 7)
-        self.df['day_of_week_cos'] = np.cos(2 * np.pi * self.df['dayofweek'] / 7)
-
-        # Cyclical encoding for month
-        self.df['month_sin'] = np.sin(2 * np.pi * self.df['month'] / 12)
-        self.df['month_cos'] = np.cos(2 * np.pi * self.df['month'] / 12)
+        values = cyclical_values(self.df['hour'], self.df['dayofweek'], self.df['month'])
+        for col in CYCLICAL_FEATURES:
+            self.df[col] = values[col].astype(DTYPE_SCHEMA[col])
 
         return self.df
 
-    def create_shifts(self, n):
-        for i in range(1, n+1):
-            self.df[f"tmp-{i}"] = self.df['tmp'].shift(i)
+    def create_shifts(self, n, features=None, leads=0):
+        """
+        Add lags (<feature>-1 ... <feature>-n) and optionally leads (<feature>+1 ... <feature>+leads) of features.
+        Values are shifted within each room_number group in the order of the rows, so no lag crosses a room boundary.
+        All columns are built in one array and added as one block.
+
+        Parameters:
+        n (int): Number of lags.
+        features (list): Features to shift, default ['tmp'].
+        leads (int): Number of leads, e.g. targets for multi-step forecasts.
 
+        Returns:
+        pd.DataFrame: The DataFrame with the new columns.
+        """
+        features = ['tmp'] if features is None else list(features)
+        steps = [-i for i in range(1, n+1)] + [j for j in range(1, leads+1)]
+        names = [f"{feature}{step:+d}" for feature in features for step in steps]
+        values = self.df[features].to_numpy()
+        if values.dtype.kind != 'f':
+            values = values.astype(np.float64)
+        if 'room_number' in self.df.columns:
+            room_codes = pd.factorize(self.df['room_number'])[0]
+        else:
+            room_codes = np.zeros(len(self.df), dtype=np.intp)
+        # rows of a room become contiguous, the position within the room decides which lags and leads exist
+        order = np.argsort(room_codes, kind='stable')
+        values = values[order]
+        room_sizes = np.bincount(room_codes)
+        room_starts = np.concatenate([[0], np.cumsum(room_sizes)[:-1]])
+        sorted_codes = room_codes[order]
+        position = np.arange(len(order)) - room_starts[sorted_codes]
+        remaining = room_sizes[sorted_codes] - position - 1
+
+        block = np.full((len(order), len(features), len(steps)), np.nan, dtype=values.dtype)
+        for k, step in enumerate(steps):
+            valid = position >= -step if step < 0 else remaining >= step
+            source = np.arange(len(order)) + step
+            block[valid, :, k] = values[source[valid]]
+        shifted = np.empty_like(block)
+        shifted[order] = block
+        self.df = pd.concat([self.df.drop(columns=names, errors='ignore'),
+                             pd.DataFrame(shifted.reshape(len(order), len(names)), columns=names, index=self.df.index)], axis=1)
         return self.df
 
     def delete_columns(self):
@@ -63,9 +167,8 @@ class FeatureEngineering:
                             'month', 
                             'dayofweek',
                             'hour',
-                            'tmp_diff_per_sec',
                             'time_diff_sec', 
-                            ], inplace=True)
+                            ] + [f'{feature}_diff_per_sec' for feature in self.diff_features], inplace=True)
     @staticmethod
     def onehotencoding(df, categorical_features:list):
         """
@@ -78,24 +181,16 @@ class FeatureEngineering:
         Returns:
         pd.DataFrame: DataFrame with one-hot encoded columns.
         """
-        df_encoded = df.copy()
-    
-        for feature in categorical_features:
-            encoder = OneHotEncoder(sparse_output=False)
-            one_hot_encoded = encoder.fit_transform(df_encoded[[feature]])
-            encoded_columns = encoder.get_feature_names_out([feature])
-            df_one_hot = pd.DataFrame(one_hot_encoded, columns=encoded_columns, index=df_encoded.index)
-            
-            # Concatenate the original DataFrame with the one-hot encoded DataFrame
-            df_encoded = pd.concat([df_encoded, df_one_hot], axis=1)
-
-
-        return df_encoded
+        # one encoder fitted over all features and a single concatenation
+        encoder = CategoricalEncoder(categorical_features).fit(df)
+        return pd.concat([df, encoder.transform(df, output="dense")], axis=1)
 
     def get_season(self, date):
         """
-        Get season dependent on date
+        Get season dependent on date (row-wise reference of add_season_column)
         """
+        # compare calendar days only, so that the last day of a season belongs to it for the whole day
+        date = pd.Timestamp(date).normalize()
         year = date.year
         seasons = {
             'winter': (pd.Timestamp(f'{year}-12-21'), pd.Timestamp(f'{year+1}-03-20')),
@@ -112,78 +207,364 @@ class FeatureEngineering:
         if date >= pd.Timestamp(f'{year}-12-21') or date <= pd.Timestamp(f'{year+1}-03-20'):
             return 'winter'
 
-    def add_season_column(self):
+    def add_season_column(self, boundaries="astronomical"):
         """
-        Add a season column to the DataFrame based on the date_time column
+        Add a categorical season column to the DataFrame based on the date_time column.
+
+        Parameters:
+        boundaries (str or dict): "astronomical", "meteorological" or a dict with the first (month, day) of every season.
         """
-        self.df['season'] = self.df['date_time'].apply(self.get_season)
+        dates = self.df['date_time'].dt
+        codes = season_lookup_table(boundaries)[dates.month.fillna(0).astype(int), dates.day.fillna(0).astype(int)]
+        # dates without a value get no season
+        codes[self.df['date_time'].isna().to_numpy()] = -1
+        self.df['season'] = pd.Categorical.from_codes(codes, dtype=DTYPE_SCHEMA['season'])
         return self.df
     
     def filter_rooms_by_prefix(self):
         """
-        Filters the DataFrame based on the start of the room_number column.
+        Splits the rooms of building E by floor, i.e. by the start of the room_number column (e.g. 'e0', 'e1', 'eu').
+        The slices are views of a PartitionIndex, sorted by room and time.
 
         Returns:
             dict: A dictionary of DataFrames where keys are room number prefixes and values are filtered DataFrames.
         """
         if self.filtered_dataframes is None:
-            self.filtered_dataframes = {}
+            if self.partition_index is None:
+                self.partition_index = PartitionIndex(self.df)
+            floors = dict.fromkeys(self.partition_index.floor_of(room) for room in self.partition_index.rooms_of(building="e"))
+            self.filtered_dataframes = {floor: self.partition_index.floor(floor) for floor in floors}
 
-            # Extract unique prefixes from room_number column
-            prefixes = self.df['room_number'].str.extract(r'^(e\d|eu)').dropna().squeeze().unique()
+        return self.filtered_dataframes
 
-            # Filter DataFrame for each prefix and store in dictionary
-            for prefix in prefixes:
-                self.filtered_dataframes[prefix] = self.df[self.df['room_number'].str.startswith(prefix)]
+class CategoricalEncoder:
+    """
+    One-hot and integer encoding of categorical features with categories fitted once, e.g. on the training data.
+    The fitted encoder can be saved with the models and reused for inference on new data or streaming batches.
+    """
+    def __init__(self, features):
+        """
+        Parameters:
+        features (list of str): Columns to encode.
+        """
+        self.features = list(features)
+        self.encoder = None
+
+    def fit(self, df):
+        """
+        Learn the categories of all features in one pass (sorted, missing values as last category if present).
+
+        Parameters:
+        df (pd.DataFrame): Data with the categorical features.
+
+        Returns:
+        CategoricalEncoder: The fitted encoder.
+        """
+        self.encoder = OneHotEncoder(handle_unknown="ignore").fit(df[self.features])
+        return self
+
+    @property
+    def categories(self):
+        """
+        Fitted categories per feature.
+        """
+        return dict(zip(self.features, self.encoder.categories_))
+
+    @property
+    def feature_names(self):
+        """
+        Names of the one-hot columns (<feature>_<category>).
+        """
+        return list(self.encoder.get_feature_names_out(self.features))
+
+    @property
+    def cardinalities(self):
+        """
+        Number of codes per feature including the code for unknown categories, e.g. the sizes of embedding layers.
+        """
+        return {feature: len(categories) + 1 for feature, categories in self.categories.items()}
+
+    def codes(self, df):
+        """
+        Integer codes of the features. Unknown categories (and missing values, unless they were seen in fit)
+        get the code len(categories).
+
+        Parameters:
+        df (pd.DataFrame): Data with the categorical features.
+
+        Returns:
+        pd.DataFrame: int32 code per feature.
+        """
+        codes = dict()
+        for feature, categories in self.categories.items():
+            known = [category for category in categories if not pd.isna(category)]
+            feature_codes = pd.Categorical(df[feature], categories=known).codes.astype(np.int32)
+            feature_codes[feature_codes == -1] = len(categories)
+            if len(known) < len(categories):
+                feature_codes[df[feature].isna().to_numpy()] = len(known)
+            codes[feature] = feature_codes
+        return pd.DataFrame(codes, index=df.index)
+
+    def transform(self, df, output="dense", dtype=np.float64):
+        """
+        Encode the features of a DataFrame (or of one batch of a stream).
+
+        Parameters:
+        df (pd.DataFrame): Data with the categorical features.
+        output (str): "dense" for a DataFrame of one-hot columns, "sparse" for a scipy CSR matrix with the columns
+                      in feature_names, "codes" for integer codes (see codes).
+        dtype: dtype of the one-hot values.
+
+        Returns:
+        pd.DataFrame or scipy.sparse.csr_matrix: The encoded features. Unknown categories give rows without a one.
+        """
+        codes = self.codes(df)
+        if output == "codes":
+            return codes
+        # column of every code in the one-hot matrix; the unknown code has no column
+        rows, columns = [], []
+        offset = 0
+        for feature, categories in self.categories.items():
+            feature_codes = codes[feature].to_numpy()
+            known = feature_codes < len(categories)
+            rows.append(np.flatnonzero(known))
+            columns.append(feature_codes[known] + offset)
+            offset += len(categories)
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        matrix = sparse.csr_matrix((np.ones(rows.size, dtype=dtype), (rows, columns)), shape=(df.shape[0], offset))
+        if output == "sparse":
+            return matrix
+        if output == "dense":
+            return pd.DataFrame(matrix.toarray(), columns=self.feature_names, index=df.index)
+        raise ValueError(f"Unknown output: {output}")
+
+    def transform_batches(self, batches, output="sparse", dtype=np.float64):
+        """
+        Encode a stream of DataFrames batch by batch with the fitted categories.
+
+        Parameters:
+        batches (iterable of pd.DataFrame): Batches of data.
+        output (str): See transform.
+        dtype: dtype of the one-hot values.
+
+        Yields:
+        The encoded batches.
+        """
+        for batch in batches:
+            yield self.transform(batch, output=output, dtype=dtype)
+
+    def save(self, path):
+        """
+        Save the fitted encoder, e.g. next to the trained models.
+        """
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path):
+        """
+        Load an encoder saved with save.
+        """
+        return joblib.load(path)
 
-        return self.filtered_dataframes
 
 class WeatherFetcher:
     """
     Class to fetch weather api and combine it with the CO2-Ampeldaten data
     """
-    def __init__(self, latitude, longitude, start_date, end_date):
+    def __init__(self, latitude, longitude, start_date, end_date, cache_directory=None, offline=False, fallback_path=None):
+        """
+        Parameters:
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+        start_date (datetime): First hour of the weather data.
+        end_date (datetime): Last hour of the weather data.
+        cache_directory (str): Directory of the local weather cache (one Parquet file per location and month). None disables the cache.
+        offline (bool): Never call meteostat, serve the data from the cache and the fallback file only.
+        fallback_path (str): Local CSV or Parquet file with hourly weather data (a 'time' column or index) that stands in
+                             for hours that are neither cached nor fetchable, e.g. in tests without network.
+        """
+        self.latitude = latitude
+        self.longitude = longitude
         self.location = Point(latitude, longitude)
         self.start_date = start_date
         self.end_date = end_date
+        self.cache_directory = cache_directory
+        self.offline = offline
+        self.fallback_path = fallback_path
         self.weather = pd.DataFrame()
 
     def get_weather(self):
         """
-        Fetch weather data and store it in the weather DataFrame.
+        Fetch weather data and store it in the weather DataFrame. With a cache, only the hours that are not cached yet are fetched.
         """
-        data = Hourly(self.location, self.start_date, self.end_date)
-        data = data.fetch()
-        self.weather = pd.DataFrame(data)
-        
+        if self.cache_directory is None:
+            data = pd.DataFrame()
+            if not self.offline:
+                try:
+                    data = self.fetch_range(self.start_date, self.end_date)
+                except Exception as e:
+                    print(f"Could not fetch weather data: {e}")
+            if data.empty:
+                data = self.load_fallback(self.start_date, self.end_date)
+            self.weather = pd.DataFrame(data)
+            return self.weather
+
+        start, end = pd.Timestamp(self.start_date).floor("h"), pd.Timestamp(self.end_date).floor("h")
+        coverage = self.load_coverage()
+        gaps = missing_ranges(coverage, start, end)
+        if not self.offline:
+            for gap_start, gap_end in gaps:
+                try:
+                    data = self.fetch_range(gap_start.to_pydatetime(), gap_end.to_pydatetime())
+                except Exception as e:
+                    print(f"Could not fetch weather data from {gap_start} to {gap_end}: {e}")
+                    continue
+                if data.empty:
+                    continue
+                self.write_cache(data)
+                # hours after the last returned value may still be published later, they stay uncovered
+                coverage = add_range(coverage, gap_start, min(gap_end, data.index.max()))
+                self.save_coverage(coverage)
+            gaps = missing_ranges(coverage, start, end)
+        weather = self.read_cache(start, end)
+        if gaps:
+            print(f"{len(gaps)} hour ranges between {start} and {end} are not cached.")
+            fallback = pd.concat([self.load_fallback(gap_start, gap_end) for gap_start, gap_end in gaps])
+            weather = pd.concat([weather, fallback]).sort_index() if not fallback.empty else weather
+        self.weather = weather
         return self.weather
 
-    def merge_dataframes(self, other_df):
+    def fetch_range(self, start, end):
         """
-        Merge the weather data with another DataFrame on the date_time column.
-        
+        Fetch the hourly weather data of a period from meteostat.
+        """
+        return Hourly(self.location, start, end).fetch()
+
+    def location_directory(self):
+        """
+        Cache directory of the location of this fetcher.
+        """
+        return os.path.join(self.cache_directory, f"{self.latitude:.4f}_{self.longitude:.4f}")
+
+    def load_coverage(self):
+        """
+        Hour ranges (inclusive) that have been fetched for this location.
+        """
+        path = os.path.join(self.location_directory(), "coverage.json")
+        if not os.path.exists(path):
+            return []
+        with open(path) as file:
+            return [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in json.load(file)]
+
+    def save_coverage(self, coverage):
+        """
+        Save the fetched hour ranges of this location.
+        """
+        path = os.path.join(self.location_directory(), "coverage.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump([[start.isoformat(), end.isoformat()] for start, end in coverage], file, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def write_cache(self, data):
+        """
+        Merge fetched hourly rows into the monthly Parquet files of this location.
+        """
+        os.makedirs(self.location_directory(), exist_ok=True)
+        data.index.name = "time"
+        for month, month_data in data.groupby(data.index.strftime("%Y-%m")):
+            path = os.path.join(self.location_directory(), f"{month}.parquet")
+            if os.path.exists(path):
+                month_data = pd.concat([pd.read_parquet(path), month_data])
+                month_data = month_data[~month_data.index.duplicated(keep="last")].sort_index()
+            month_data.to_parquet(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def read_cache(self, start, end):
+        """
+        Read the cached hourly rows between start and end (inclusive).
+        """
+        months = pd.period_range(start, end, freq="M").strftime("%Y-%m")
+        paths = [os.path.join(self.location_directory(), f"{month}.parquet") for month in months]
+        frames = [pd.read_parquet(path) for path in paths if os.path.exists(path)]
+        if not frames:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="time"))
+        weather = pd.concat(frames)
+        return weather[(weather.index >= start) & (weather.index <= end)]
+
+    def load_fallback(self, start, end):
+        """
+        Rows of the local fallback file between start and end (inclusive), empty without a fallback file.
+        """
+        if self.fallback_path is None:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="time"))
+        if self.fallback_path.endswith(".parquet"):
+            fallback = pd.read_parquet(self.fallback_path)
+        else:
+            fallback = pd.read_csv(self.fallback_path, parse_dates=["time"])
+        if "time" in fallback.columns:
+            fallback = fallback.set_index("time")
+        fallback.index = pd.to_datetime(fallback.index)
+        return fallback[(fallback.index >= pd.Timestamp(start)) & (fallback.index <= pd.Timestamp(end))]
+
+    def merge_dataframes(self, other_df, how="exact", tolerance="30min"):
+        """
+        Merge the weather data with another DataFrame on the date_time column. The input DataFrame is not modified.
+
         Parameters:
             other_df (pd.DataFrame): The other DataFrame to merge with.
-            
+            how (str): "exact" keeps only rows whose timestamp matches a weather hour exactly (inner merge, as before).
+                       "hourly" assigns the weather of the hour each row falls into, "asof" the weather of the nearest hour
+                       within tolerance. Both look up each unique timestamp once, broadcast the result to all rows (rooms)
+                       with that timestamp and keep all rows (NaN without weather).
+            tolerance (str): Maximum distance to the nearest weather hour for how="asof".
+
         Returns:
             pd.DataFrame: The merged DataFrame.
         """
-        other_df['date_time'] = pd.to_datetime(other_df['date_time'])
-        merged_df = pd.merge(other_df, self.weather, left_on='date_time', right_on='time', how='inner')
-        return merged_df
-
-    def combine_weather(self, other_df):
+        times = pd.to_datetime(other_df['date_time'])
+        if how == "exact":
+            left = other_df.copy(deep=False)
+            left['date_time'] = times
+            return pd.merge(left, self.weather, left_on='date_time', right_on='time', how='inner')
+        if how == "hourly":
+            keys = times.dt.floor('h')
+        elif how == "asof":
+            keys = times
+        else:
+            raise ValueError(f"Unknown join mode: {how}")
+
+        # one weather lookup per unique timestamp instead of per row
+        codes, unique_times = pd.factorize(keys)
+        unique_times = pd.DatetimeIndex(unique_times)
+        if how == "hourly":
+            unique_weather = self.weather.reindex(unique_times)
+        else:
+            order = np.argsort(unique_times)
+            nearest = pd.merge_asof(pd.DataFrame({'date_time': unique_times[order]}), self.weather.sort_index(),
+                                    left_on='date_time', right_index=True, direction='nearest', tolerance=pd.Timedelta(tolerance))
+            unique_weather = nearest.drop(columns='date_time').iloc[np.argsort(order)]
+        # an empty last row for rows without a valid timestamp (code -1)
+        unique_weather = unique_weather.reset_index(drop=True).reindex(range(len(unique_times) + 1))
+        merged = other_df.copy(deep=False)
+        merged['date_time'] = times
+        for col in unique_weather.columns:
+            merged[col] = unique_weather[col].iloc[codes].array
+        return merged
+
+    def combine_weather(self, other_df, how="exact", tolerance="30min"):
         """
         Fetch weather data and merge it with another DataFrame.
         
         Parameters:
             other_df (pd.DataFrame): The other DataFrame to merge with.
+            how (str): Join mode of merge_dataframes ("exact", "hourly" or "asof").
+            tolerance (str): Maximum distance to the nearest weather hour for how="asof".
             
         Returns:
             pd.DataFrame: The merged DataFrame.
         """
         self.get_weather()
-        return self.merge_dataframes(other_df)
+        return self.merge_dataframes(other_df, how=how, tolerance=tolerance)
     
 
     
@@ -192,3 +573,35 @@ class WeatherFetcher:
 
     
         
+
+
+def add_range(ranges, start, end):
+    """
+    Add an inclusive hour range to a list of ranges and merge overlapping or adjacent ranges.
+    """
+    merged = []
+    for range_start, range_end in sorted(ranges + [(start, end)]):
+        if merged and range_start <= merged[-1][1] + pd.Timedelta(hours=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+        else:
+            merged.append((range_start, range_end))
+    return merged
+
+
+def missing_ranges(ranges, start, end):
+    """
+    Inclusive hour ranges between start and end that are not covered by ranges.
+    """
+    gaps = []
+    current = start
+    for range_start, range_end in sorted(ranges):
+        if range_end < current:
+            continue
+        if range_start > end:
+            break
+        if range_start > current:
+            gaps.append((current, range_start - pd.Timedelta(hours=1)))
+        current = range_end + pd.Timedelta(hours=1)
+    if current <= end:
+        gaps.append((current, end))
+    return gaps
@@ -0,0 +1,429 @@
+import os
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+from torch.utils.data import Dataset
+from feature_engineering import CYCLICAL_FEATURES, cyclical_values
+
+MODEL_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trained_models")
+# Checkpoint number and name of the four forecasters (prefix of the prediction columns in the dashboard data)
+MODEL_VARIANTS = {0: "Vanilla", 1: "Seasons", 2: "Weather", 3: "Combined"}
+
+
+class SlidingWindowDataset(Dataset):
+    """
+    Sliding windows over the feature data of all rooms for the BiLSTM forecasters, without materializing the windows.
+    The features are stored once as a float32 array in which the rows of every room are contiguous and in time order.
+    A window is a view of lag consecutive rows of one room, the target are the next horizon values of the target column.
+    The array can be a memory-mapped .npy file, so only the accessed windows are read from disk.
+    """
+    def __init__(self, values, rooms, room_starts, room_lengths, features, target="tmp", lag=2, horizon=1):
+        """
+        Parameters:
+        values (np.ndarray): float32 array of shape (rows, features), rows of a room contiguous and in time order.
+        rooms (list): Room numbers in the order of their blocks in values.
+        room_starts (np.ndarray): First row of every room in values.
+        room_lengths (np.ndarray): Number of rows of every room.
+        features (list): Names of the columns of values.
+        target (str): Column that is forecast.
+        lag (int): Number of time steps in a window.
+        horizon (int): Number of future values of the target per window.
+        """
+        if lag < 1 or horizon < 1:
+            raise ValueError("lag and horizon must be at least 1")
+        self.values = values
+        self.rooms = list(rooms)
+        self.room_starts = np.asarray(room_starts, dtype=np.int64)
+        self.room_lengths = np.asarray(room_lengths, dtype=np.int64)
+        self.features = list(features)
+        self.target = target
+        self.target_index = self.features.index(target)
+        self.lag = lag
+        self.horizon = horizon
+        # number of complete windows per room and the first window index of every room
+        self.room_windows = np.maximum(self.room_lengths - lag - horizon + 1, 0)
+        self.window_offsets = np.concatenate([[0], np.cumsum(self.room_windows)])
+
+    @classmethod
+    def from_frame(cls, df, features, target="tmp", lag=2, horizon=1, path=None, date_time_column="date_time"):
+        """
+        Build the dataset from a feature DataFrame. The rows are ordered by room (first appearance) and time.
+
+        Parameters:
+        df (pd.DataFrame): Feature data with a room_number column.
+        features (list): Columns used as model input, must contain the target.
+        target (str): Column that is forecast.
+        lag (int): Number of time steps in a window.
+        horizon (int): Number of future values of the target per window.
+        path (str): If given, the array is saved as .npy file (with the room offsets in <path>.rooms.csv)
+                    and opened memory-mapped instead of being kept in memory.
+        date_time_column (str): Column with the timestamps.
+
+        Returns:
+        SlidingWindowDataset: The dataset.
+        """
+        room_codes, rooms = pd.factorize(df["room_number"])
+        if date_time_column in df.columns:
+            order = np.lexsort((df[date_time_column].to_numpy(), room_codes))
+        else:
+            order = np.argsort(room_codes, kind="stable")
+        values = np.ascontiguousarray(df[features].to_numpy(dtype=np.float32)[order])
+        room_lengths = np.bincount(room_codes, minlength=len(rooms))
+        room_starts = np.concatenate([[0], np.cumsum(room_lengths)[:-1]])
+        if path is None:
+            return cls(values, rooms, room_starts, room_lengths, features, target=target, lag=lag, horizon=horizon)
+        np.save(path, values)
+        pd.DataFrame({"room_number": rooms, "start": room_starts, "length": room_lengths}).to_csv(rooms_path(path), index=False)
+        del values
+        return cls.load(path, features, target=target, lag=lag, horizon=horizon)
+
+    @classmethod
+    def load(cls, path, features, target="tmp", lag=2, horizon=1):
+        """
+        Open a dataset saved by from_frame memory-mapped. Pages of the file are read on access; the copy-on-write mode
+        gives writable arrays for torch.from_numpy without changing the file.
+
+        Parameters:
+        path (str): The .npy file.
+        features (list): Names of the columns of the array.
+        target (str): Column that is forecast.
+        lag (int): Number of time steps in a window.
+        horizon (int): Number of future values of the target per window.
+
+        Returns:
+        SlidingWindowDataset: The dataset.
+        """
+        values = np.load(path, mmap_mode="c")
+        offsets = pd.read_csv(rooms_path(path), dtype={"room_number": str})
+        return cls(values, offsets.room_number, offsets.start.to_numpy(), offsets.length.to_numpy(), features,
+                   target=target, lag=lag, horizon=horizon)
+
+    def __len__(self):
+        return int(self.window_offsets[-1])
+
+    def window_start(self, index):
+        """
+        First row in values of the window(s) with the given index (scalar or array).
+        """
+        index = np.asarray(index)
+        if np.any((index < 0) | (index >= len(self))):
+            raise IndexError("window index out of range")
+        room = np.searchsorted(self.window_offsets, index, side="right") - 1
+        return self.room_starts[room] + index - self.window_offsets[room]
+
+    def __getitem__(self, index):
+        """
+        Return the window and its targets as views of the underlying array.
+
+        Returns:
+        tuple: Input of shape (lag, features) and targets of shape (horizon,).
+        """
+        start = int(self.window_start(index))
+        x = self.values[start:start + self.lag]
+        y = self.values[start + self.lag:start + self.lag + self.horizon, self.target_index]
+        return x, y
+
+    def windows(self, room):
+        """
+        All windows of one room as a strided view, without copying.
+
+        Parameters:
+        room (str): Room number.
+
+        Returns:
+        tuple: Inputs of shape (windows, lag, features) and targets of shape (windows, horizon), both views.
+        """
+        position = self.rooms.index(room)
+        start, length = self.room_starts[position], self.room_lengths[position]
+        room_values = self.values[start:start + length]
+        n_windows = int(self.room_windows[position])
+        if n_windows == 0:
+            # rooms shorter than lag + horizon (e.g. after dropna or filtering) have no windows
+            return (np.empty((0, self.lag, self.values.shape[1]), dtype=self.values.dtype),
+                    np.empty((0, self.horizon), dtype=self.values.dtype))
+        x = np.lib.stride_tricks.sliding_window_view(room_values, self.lag, axis=0)[:n_windows].transpose(0, 2, 1)
+        y = np.lib.stride_tricks.sliding_window_view(room_values[self.lag:, self.target_index], self.horizon)[:n_windows]
+        return x, y
+
+    def batch(self, indices):
+        """
+        Gather several windows into one contiguous batch with a single indexing operation.
+
+        Parameters:
+        indices (array-like): Window indices.
+
+        Returns:
+        tuple: torch tensors of shape (batch, lag, features) and (batch, horizon).
+        """
+        starts = self.window_start(indices)
+        x = self.values[starts[:, None] + np.arange(self.lag)]
+        y = self.values[starts[:, None] + self.lag + np.arange(self.horizon), self.target_index]
+        return torch.from_numpy(x), torch.from_numpy(y)
+
+    def split(self, test_share=0.2):
+        """
+        Per-room train/test split of the windows: the last test_share of the windows of every room are test data.
+
+        Returns:
+        tuple: Window indices for training and for testing.
+        """
+        test_windows = np.ceil(self.room_windows * test_share).astype(np.int64)
+        first_test = self.window_offsets[1:] - test_windows
+        room = np.searchsorted(self.window_offsets, np.arange(len(self)), side="right") - 1
+        is_test = np.arange(len(self)) >= first_test[room]
+        return np.flatnonzero(~is_test), np.flatnonzero(is_test)
+
+    def batches(self, batch_size=256, shuffle=False, seed=None, indices=None):
+        """
+        Iterate over all windows in batches, as a lightweight alternative to a DataLoader.
+
+        Parameters:
+        batch_size (int): Number of windows per batch.
+        shuffle (bool): Random order of the windows.
+        seed (int): Seed for the random order.
+        indices (np.ndarray): Iterate only over these windows (e.g. the training windows from split).
+
+        Yields:
+        tuple: Batches as returned by batch.
+        """
+        indices = np.arange(len(self)) if indices is None else np.array(indices)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(indices)
+        for begin in range(0, len(indices), batch_size):
+            yield self.batch(indices[begin:begin + batch_size])
+
+
+def rooms_path(path):
+    """
+    Path of the file with the room offsets of a dataset saved at path.
+    """
+    return os.path.splitext(path)[0] + ".rooms.csv"
+
+
+class BiLSTMForecaster(nn.Module):
+    """
+    Architecture of the checkpoints in trained_models: one bidirectional LSTM layer, its output at the last time step
+    and two linear layers. The state dicts do not record the activation between fc1 and fc2, ReLU is used.
+    """
+    def __init__(self, input_size, hidden_size=64, fc_size=32):
+        """
+        Parameters:
+        input_size (int): Number of features per time step.
+        hidden_size (int): Hidden size of each LSTM direction.
+        fc_size (int): Output size of fc1.
+        """
+        super().__init__()
+        self.bi_lstm = nn.LSTM(input_size, hidden_size, batch_first=True, bidirectional=True)
+        self.fc1 = nn.Linear(2 * hidden_size, fc_size)
+        self.relu = nn.ReLU()
+        self.fc2 = nn.Linear(fc_size, 1)
+
+    def forward(self, x):
+        """
+        Parameters:
+        x (torch.Tensor): Input of shape (batch, time steps, features).
+
+        Returns:
+        torch.Tensor: Forecast of shape (batch, 1).
+        """
+        out, _ = self.bi_lstm(x)
+        return self.fc2(self.relu(self.fc1(out[:, -1, :])))
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        """
+        Create the model with the sizes of a state dict and load its weights.
+        """
+        hidden_size = state_dict["bi_lstm.weight_hh_l0"].shape[1]
+        model = cls(input_size=state_dict["bi_lstm.weight_ih_l0"].shape[1], hidden_size=hidden_size,
+                    fc_size=state_dict["fc1.weight"].shape[0])
+        model.load_state_dict(state_dict)
+        return model.eval()
+
+    @property
+    def input_size(self):
+        return self.bi_lstm.input_size
+
+
+# Loaded models per checkpoint path with the modification time of the file they were loaded from
+_MODEL_CACHE = dict()
+
+
+def load_forecaster(path):
+    """
+    Load a checkpoint as BiLSTMForecaster in eval mode. Models are cached per file and reloaded only if the file changed.
+
+    Parameters:
+    path (str): Path of the .pth state dict.
+
+    Returns:
+    BiLSTMForecaster: The model.
+    """
+    path = os.path.abspath(path)
+    modified = os.path.getmtime(path)
+    cached = _MODEL_CACHE.get(path)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+    state_dict = torch.load(path, map_location="cpu", weights_only=True)
+    model = BiLSTMForecaster.from_state_dict(state_dict)
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    # a rewritten checkpoint replaces the stale model instead of adding a second one
+    _MODEL_CACHE[path] = (modified, model)
+    return model
+
+
+def set_torch_threads(num_threads=None, interop_threads=None):
+    """
+    Configure the number of CPU threads of torch. The inter-op threads can only be set before the first parallel work.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+
+class ForecastEngine:
+    """
+    Next-step temperature forecasts for all rooms with the trained BiLSTM models: one input window per room
+    and one batched forward pass per model.
+    """
+    def __init__(self, feature_columns, model_directory=MODEL_DIRECTORY, lag=1, sample_time="60min",
+                 num_threads=None, interop_threads=None, date_time_column="date_time"):
+        """
+        Parameters:
+        feature_columns (dict): Input columns per model variant (checkpoint number or name from MODEL_VARIANTS),
+                                in the order used in training. Their number must match the input size of the checkpoint.
+        model_directory (str): Directory with the <number>_lstm_model.pth checkpoints.
+        lag (int): Number of time steps per input window (1 if the lags are columns, see FeatureEngineering.create_shifts).
+        sample_time (str): Interval between two rows of a room, the forecast is for the last time plus sample_time.
+        num_threads (int): Number of torch intra-op threads, None keeps the torch default.
+        interop_threads (int): Number of torch inter-op threads, None keeps the torch default.
+        date_time_column (str): Column with the timestamps.
+        """
+        names = {name: number for number, name in MODEL_VARIANTS.items()}
+        self.feature_columns = {names.get(variant, variant): list(columns) for variant, columns in feature_columns.items()}
+        self.model_directory = model_directory
+        self.lag = lag
+        self.sample_time = sample_time
+        self.date_time_column = date_time_column
+        set_torch_threads(num_threads, interop_threads)
+
+    def model(self, variant):
+        """
+        The cached model of a variant, checked against its configured input columns.
+        """
+        model = load_forecaster(os.path.join(self.model_directory, f"{variant}_lstm_model.pth"))
+        if model.input_size != len(self.feature_columns[variant]):
+            raise ValueError(f"Model {variant} expects {model.input_size} features, {len(self.feature_columns[variant])} columns are configured.")
+        return model
+
+    def build_inputs(self, df, columns):
+        """
+        Input windows of the last lag rows of every room.
+
+        Parameters:
+        df (pd.DataFrame): Feature data of all rooms.
+        columns (list): Input columns.
+
+        Returns:
+        tuple: Room numbers, their last timestamps and a float32 tensor of shape (rooms, lag, features).
+        """
+        room_codes, rooms = pd.factorize(df["room_number"])
+        times = df[self.date_time_column].to_numpy()
+        order = np.lexsort((times, room_codes))
+        room_ends = np.cumsum(np.bincount(room_codes, minlength=len(rooms)))
+        if np.any(np.diff(np.concatenate([[0], room_ends])) < self.lag):
+            raise ValueError(f"Every room needs at least {self.lag} rows.")
+        # positions of the last lag rows of every room in time order
+        rows = order[room_ends[:, None] - self.lag + np.arange(self.lag)]
+        values = df[columns].to_numpy(dtype=np.float32)
+        return list(rooms), times[rows[:, -1]], torch.from_numpy(values[rows])
+
+    def predict(self, df, variants=None):
+        """
+        Forecast the next value of every room with each model.
+
+        Parameters:
+        df (pd.DataFrame): Feature data of all rooms, containing the input columns of the variants.
+        variants (list): Checkpoint numbers to use, default all configured variants.
+
+        Returns:
+        pd.DataFrame: One row per room with the time of the forecast and a '<Variant> Predictions' column per model.
+        """
+        variants = list(self.feature_columns) if variants is None else variants
+        result = None
+        with torch.inference_mode():
+            for variant in variants:
+                rooms, last_times, inputs = self.build_inputs(df, self.feature_columns[variant])
+                if result is None:
+                    result = pd.DataFrame({"room_number": rooms,
+                                           self.date_time_column: pd.DatetimeIndex(last_times) + pd.Timedelta(self.sample_time)})
+                predictions = self.model(variant)(inputs)
+                result[f"{MODEL_VARIANTS.get(variant, variant)} Predictions"] = predictions[:, 0].numpy()
+        return result
+
+    def rollout(self, df, horizon=24, variants=None, target="tmp", lags=None):
+        """
+        Recursive multi-step forecasts for all rooms at once. Every step is one batched forward pass; its prediction
+        becomes the target of the next input row, the lag columns (<target>-1 ... <target>-n, see
+        FeatureEngineering.create_shifts) move by one step, a <target>_diff column is updated and the cyclical time
+        features are computed for the new time. All other inputs keep their last known values.
+
+        Parameters:
+        df (pd.DataFrame): Feature data of all rooms, containing the input columns of the variants.
+        horizon (int): Number of steps of sample_time to forecast.
+        variants (list): Checkpoint numbers to use, default all configured variants.
+        target (str): Column that is forecast.
+        lags (int): Number of lag columns of the target, default all <target>-i columns in the inputs.
+
+        Returns:
+        pd.DataFrame: One row per room and step with the forecast time, the step and a '<Variant> Predictions' column per model.
+        """
+        variants = list(self.feature_columns) if variants is None else variants
+        step_time = pd.Timedelta(self.sample_time)
+        result = None
+        with torch.inference_mode():
+            for variant in variants:
+                columns = self.feature_columns[variant]
+                model = self.model(variant)
+                rooms, last_times, inputs = self.build_inputs(df, columns)
+                n_lags = lags if lags is not None else sum(f"{target}-{i}" in columns for i in range(1, len(columns) + 1))
+                # target column followed by its lags, each one step older than the one before
+                chain = torch.tensor([columns.index(target)] + [columns.index(f"{target}-{i}") for i in range(1, n_lags + 1)])
+                diff = columns.index(f"{target}_diff") if f"{target}_diff" in columns else None
+                cyclical_columns = [col for col in CYCLICAL_FEATURES if col in columns]
+                cyclical_index = torch.tensor([columns.index(col) for col in cyclical_columns], dtype=torch.long)
+
+                # times and cyclical features of all rooms and steps, computed once: shape (rooms, horizon, features)
+                times = pd.DatetimeIndex(last_times.repeat(horizon)) + np.tile(np.arange(1, horizon + 1), len(rooms)) * step_time
+                if cyclical_columns:
+                    values = cyclical_values(times.hour.to_numpy(), times.dayofweek.to_numpy(), times.month.to_numpy())
+                    cyclical = torch.from_numpy(np.stack([values[col] for col in cyclical_columns], axis=1)
+                                                .astype(np.float32).reshape(len(rooms), horizon, -1))
+
+                predictions = torch.empty(len(rooms), horizon)
+                window = inputs.clone()
+                for step in range(horizon):
+                    y = model(window)[:, 0]
+                    predictions[:, step] = y
+                    row = window[:, -1].clone()
+                    last = window[:, -1]
+                    row[:, chain[1:]] = last[:, chain[:-1]]
+                    row[:, chain[0]] = y
+                    if diff is not None:
+                        row[:, diff] = y - last[:, chain[0]]
+                    if cyclical_columns:
+                        row[:, cyclical_index] = cyclical[:, step]
+                    window = torch.cat([window[:, 1:], row[:, None]], dim=1)
+
+                if result is None:
+                    result = pd.DataFrame({"room_number": np.repeat(rooms, horizon), self.date_time_column: times,
+                                           "step": np.tile(np.arange(1, horizon + 1), len(rooms))})
+                result[f"{MODEL_VARIANTS.get(variant, variant)} Predictions"] = predictions.flatten().numpy()
+        return result
+
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+from forecast import MODEL_DIRECTORY, MODEL_VARIANTS, SlidingWindowDataset, load_forecaster, set_torch_threads
+from training import dataset_columns
+
+# Suffixes of the exported files next to <number>_lstm_model
+EXPORT_SUFFIXES = {"scripted": ".scripted.pt", "traced": ".traced.pt", "quantized": ".int8.pt"}
+
+
+def example_input(model, batch_size:int = 1, lag:int = 1):
+    """
+    Random input of the shape expected by a BiLSTMForecaster, used for tracing and benchmarks.
+    """
+    return torch.randn(batch_size, lag, model.input_size)
+
+
+def quantize_model(model):
+    """
+    Dynamic int8 quantization of the LSTM and linear layers. Weights are stored as int8, activations are quantized
+    on the fly, so no calibration data is needed. The original model is not changed.
+
+    Parameters:
+    model (BiLSTMForecaster): The float model.
+
+    Returns:
+    nn.Module: The quantized model.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+def export_model(model, path:str, method:str = "scripted", lag:int = 1):
+    """
+    Compile a model with TorchScript and save it. The file can be loaded with torch.jit.load without the Python class.
+
+    Parameters:
+    model (nn.Module): The model in eval mode.
+    path (str): Output file.
+    method (str): "scripted" for torch.jit.script, "traced" for torch.jit.trace with an example input.
+    lag (int): Number of time steps of the example input for tracing.
+
+    Returns:
+    torch.jit.ScriptModule: The compiled model.
+    """
+    model = model.eval()
+    with torch.inference_mode():
+        if method == "scripted":
+            compiled = torch.jit.script(model)
+        elif method == "traced":
+            compiled = torch.jit.trace(model, example_input(model, lag=lag))
+        else:
+            raise ValueError(f"Unknown export method: {method}")
+    compiled.save(path)
+    return compiled
+
+
+def export_variants(output_directory:str = MODEL_DIRECTORY, model_directory:str = MODEL_DIRECTORY, variants = None, lag:int = 1):
+    """
+    Export every checkpoint as scripted, traced and dynamically quantized (traced) TorchScript file.
+
+    Parameters:
+    output_directory (str): Directory of the exported files, named <number>_lstm_model<suffix> (see EXPORT_SUFFIXES).
+    model_directory (str): Directory with the <number>_lstm_model.pth checkpoints.
+    variants (list): Checkpoint numbers, default all in MODEL_VARIANTS.
+    lag (int): Number of time steps of the example input for tracing.
+
+    Returns:
+    dict: Paths of the exported files per variant and method.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    paths = dict()
+    for variant in (MODEL_VARIANTS if variants is None else variants):
+        model = load_forecaster(os.path.join(model_directory, f"{variant}_lstm_model.pth"))
+        base = os.path.join(output_directory, f"{variant}_lstm_model")
+        paths[variant] = {method: base + suffix for method, suffix in EXPORT_SUFFIXES.items()}
+        export_model(model, paths[variant]["scripted"], "scripted")
+        export_model(model, paths[variant]["traced"], "traced", lag=lag)
+        # quantized LSTMs are traced, scripting them is not supported for all torch versions
+        export_model(quantize_model(model), paths[variant]["quantized"], "traced", lag=lag)
+    return paths
+
+
+def held_out_inputs(dataset, share:float = 0.2, max_windows:int = None, seed:int = 0):
+    """
+    Input windows from the last share of every room, the same split as the per-room test data of the forecasters.
+
+    Parameters:
+    dataset (forecast.SlidingWindowDataset): Windows of the feature data.
+    share (float): Share of the windows of every room at its end.
+    max_windows (int): Random subset of at most this many windows.
+    seed (int): Seed for the subset.
+
+    Returns:
+    torch.Tensor: Inputs of shape (windows, lag, features).
+    """
+    indices = dataset.split(share)[1]
+    if max_windows is not None and indices.size > max_windows:
+        indices = np.sort(np.random.default_rng(seed).choice(indices, max_windows, replace=False))
+    return dataset.batch(indices)[0]
+
+
+def verify_drift(reference, candidate, inputs, tolerance:float = 0.1, batch_size:int = 4096):
+    """
+    Compare the predictions of an exported model with the float model.
+
+    Parameters:
+    reference (nn.Module): The float model.
+    candidate (nn.Module): Scripted, traced or quantized model.
+    inputs (torch.Tensor): Held-out inputs of shape (windows, lag, features).
+    tolerance (float): Largest accepted absolute difference (in °C for the temperature forecasters).
+    batch_size (int): Number of windows per forward pass.
+
+    Returns:
+    dict: Maximum, mean and root mean squared difference and whether the maximum is within the tolerance.
+    """
+    with torch.inference_mode():
+        differences = torch.cat([candidate(batch) - reference(batch) for batch in torch.split(inputs, batch_size)])
+    differences = differences.abs().flatten()
+    result = {
+        "windows": int(differences.numel()),
+        "max_abs": float(differences.max()),
+        "mean_abs": float(differences.mean()),
+        "rmse": float(differences.square().mean().sqrt()),
+    }
+    result["passed"] = result["max_abs"] <= tolerance
+    return result
+
+
+def benchmark_inference(models:dict, input_size:int, batch_sizes = (1, 32, 256, 2048), lag:int = 1, repeats:int = 20, warmup:int = 3):
+    """
+    Latency and throughput of several versions of a model at different batch sizes.
+
+    Parameters:
+    models (dict): Name (e.g. eager, scripted, quantized) and model.
+    input_size (int): Number of features per time step.
+    batch_sizes (tuple): Batch sizes to measure.
+    lag (int): Number of time steps per window.
+    repeats (int): Measured forward passes per model and batch size, the median is reported.
+    warmup (int): Forward passes before measuring (TorchScript optimizes on the first calls).
+
+    Returns:
+    pd.DataFrame: One row per model and batch size with latency in ms and windows per second.
+    """
+    records = []
+    with torch.inference_mode():
+        for batch_size in batch_sizes:
+            x = torch.randn(batch_size, lag, input_size)
+            for name, model in models.items():
+                for _ in range(warmup):
+                    model(x)
+                timings = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    model(x)
+                    timings.append(time.perf_counter() - start)
+                latency = float(np.median(timings))
+                records.append({"model": name, "batch_size": batch_size, "latency_ms": latency * 1000,
+                                "windows_per_s": batch_size / latency})
+    return pd.DataFrame(records)
+
+
+def compare_exports(variant = 0, model_directory:str = MODEL_DIRECTORY, inputs = None, batch_sizes = (1, 32, 256, 2048),
+                    lag:int = 1, tolerance:float = 0.1, paths:dict = None):
+    """
+    Check the drift of the exported versions of one checkpoint and benchmark them against the eager float model.
+
+    Parameters:
+    variant: Checkpoint number.
+    model_directory (str): Directory with the checkpoints.
+    inputs (torch.Tensor): Held-out inputs (see held_out_inputs). If None, random inputs are used,
+                           which only checks the export itself, not the drift on real data.
+    batch_sizes (tuple): Batch sizes of the benchmark.
+    lag (int): Number of time steps per window.
+    tolerance (float): Largest accepted absolute difference.
+    paths (dict): Exported files per method (see export_variants). They are loaded with torch.jit.load, so the check covers
+                  the files the forecast nodes load. If None, the versions are compiled in memory.
+
+    Returns:
+    tuple: Drift per exported version (pd.DataFrame) and benchmark results (pd.DataFrame).
+    """
+    model = load_forecaster(os.path.join(model_directory, f"{variant}_lstm_model.pth"))
+    if paths is not None:
+        models = {"eager": model, **{method: torch.jit.load(path, map_location="cpu").eval() for method, path in paths.items()}}
+    else:
+        with torch.inference_mode():
+            models = {
+                "eager": model,
+                "scripted": torch.jit.freeze(torch.jit.script(model)),
+                "traced": torch.jit.freeze(torch.jit.trace(model, example_input(model, lag=lag))),
+                "quantized": quantize_model(model),
+            }
+    if inputs is None:
+        inputs = torch.randn(4096, lag, model.input_size)
+    drift = pd.DataFrame([{"model": name, **verify_drift(model, candidate, inputs, tolerance)}
+                          for name, candidate in models.items() if name != "eager"])
+    benchmark = benchmark_inference(models, model.input_size, batch_sizes=batch_sizes, lag=lag)
+    return drift, benchmark
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the BiLSTM checkpoints as TorchScript and int8 models, check their drift "
+                                                 "on the held-out windows and benchmark them.")
+    parser.add_argument("data", help="Feature data (.parquet or .pkl) from FeatureEngineering.feature_engineering.")
+    parser.add_argument("features", help="JSON file with the input columns per variant, e.g. {\"0\": [...], \"1\": [...]}.")
+    parser.add_argument("--variants", nargs="+", type=int, default=None, help="Default all variants in the features file.")
+    parser.add_argument("--output", default=None, help="Directory of the exported files; nothing is written if omitted.")
+    parser.add_argument("--target", default="tmp")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--max-windows", type=int, default=20000, help="Random subset of the held-out windows for the drift check.")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 32, 256, 2048])
+    parser.add_argument("--lag", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    set_torch_threads(args.threads)
+    data = pd.read_parquet(args.data) if args.data.endswith(".parquet") else pd.read_pickle(args.data)
+    with open(args.features) as file:
+        feature_columns = {int(key): columns for key, columns in json.load(file).items()}
+    variants = list(feature_columns) if args.variants is None else args.variants
+    # with --output the written files are checked, otherwise versions compiled in memory
+    paths = export_variants(args.output, variants=variants, lag=args.lag) if args.output is not None else {}
+    passed = True
+    for variant in variants:
+        columns = feature_columns[variant]
+        dataset = SlidingWindowDataset.from_frame(data, dataset_columns(columns, args.target), target=args.target, lag=args.lag)
+        # the target is no model input if it is only stored for the labels
+        inputs = held_out_inputs(dataset, max_windows=args.max_windows)[:, :, :len(columns)]
+        drift, benchmark = compare_exports(variant, inputs=inputs, batch_sizes=args.batch_sizes, lag=args.lag, tolerance=args.tolerance,
+                                           paths=paths.get(variant))
+        passed &= bool(drift.passed.all())
+        print(f"Model {variant} ({MODEL_VARIANTS[variant]}), drift on {len(inputs)} held-out windows:")
+        print(drift.to_string(index=False))
+        print(benchmark.pivot(index="batch_size", columns="model", values="latency_ms").to_string(float_format="{:.3f}".format))
+    if not passed:
+        print(f"Drift above the tolerance of {args.tolerance}.")
+        sys.exit(1)
@@ -0,0 +1,142 @@
+import re
+import numpy as np
+import pandas as pd
+from schema import BUILDING_NAMES
+
+
+def room_prefix(room:str):
+    """
+    Letters at the start of a room number (e.g. 'eu' for eu02, 'e' for e104).
+    """
+    return re.match(r"[a-z]*", room).group()
+
+
+def building_of(room:str):
+    """
+    Building of a room number, using the mapping of room prefixes in BUILDING_NAMES.
+    """
+    prefix = room_prefix(room)
+    return BUILDING_NAMES.get(prefix, prefix)
+
+
+def floor_of(room:str):
+    """
+    Floor key of a room number in the form used by FeatureEngineering.filter_rooms_by_prefix: the room prefix followed by
+    the floor digit (e.g. 'e0' for e001, 'e1' for e104), or the prefix alone for basement rooms (e.g. 'eu' for eu02).
+    """
+    prefix = room_prefix(room)
+    if prefix.endswith("u") or len(room) == len(prefix):
+        return prefix
+    return room[:len(prefix) + 1]
+
+
+class PartitionIndex:
+    """
+    Index over data sorted by building, floor, room and time. Every building, floor and room covers a contiguous range of rows,
+    so selecting one is a dictionary lookup followed by a slice of the sorted frame (a view, no boolean mask over all rows).
+    """
+    def __init__(self, df, room_column:str = "room_number", floor_column:str = None, date_time_column:str = "date_time"):
+        """
+        Parameters:
+        df (pd.DataFrame): The data. It is sorted once into self.df.
+        room_column (str): Column with the room numbers.
+        floor_column (str): Column with the floor of every row (e.g. 'Etage' in the dashboard data). If None,
+                            the floor is derived from the room number (see floor_of).
+        date_time_column (str): Column with the timestamps. Rows of a room are sorted by it if it exists.
+        """
+        self.room_column = room_column
+        room_codes, room_names = pd.factorize(df[room_column].astype(str))
+        room_names = list(room_names)
+        if floor_column is not None:
+            floors = pd.Series(df[floor_column].to_numpy()).groupby(room_codes).first().reindex(range(len(room_names))).tolist()
+        else:
+            floors = [floor_of(room) for room in room_names]
+        buildings = [building_of(room) for room in room_names]
+
+        # rank of every room in the order (building, floor, room)
+        room_order = sorted(range(len(room_names)), key = lambda code: (buildings[code], str(floors[code]), room_names[code]))
+        rank = np.empty(len(room_names), dtype = np.int64)
+        rank[room_order] = np.arange(len(room_names))
+        keys = rank[room_codes]
+        if date_time_column in df.columns:
+            order = np.lexsort((df[date_time_column].to_numpy(), keys))
+        else:
+            order = np.argsort(keys, kind = "stable")
+        self.df = df.iloc[order].reset_index(drop = True)
+
+        stops = np.cumsum(np.bincount(keys, minlength = len(room_names)))
+        starts = stops - np.bincount(keys, minlength = len(room_names))
+        self.room_ranges = {room_names[code]: (int(starts[i]), int(stops[i])) for i, code in enumerate(room_order)}
+        self.room_floor = {room_names[code]: floors[code] for code in room_order}
+        self.room_building = {room_names[code]: buildings[code] for code in room_order}
+        self.floor_ranges = self._group_ranges(self.room_floor)
+        self.building_ranges = self._group_ranges(self.room_building)
+
+    def _group_ranges(self, groups:dict):
+        """
+        Row ranges of floors or buildings, built from the ranges of their rooms.
+        """
+        ranges = dict()
+        for room, group in groups.items():
+            start, stop = self.room_ranges[room]
+            if group in ranges:
+                if ranges[group][1] != start:
+                    raise ValueError(f"Rows of {group} are not contiguous, floor labels must be unique across buildings.")
+                start = ranges[group][0]
+            ranges[group] = (start, stop)
+        return ranges
+
+    @property
+    def rooms(self):
+        return list(self.room_ranges)
+
+    @property
+    def floors(self):
+        return list(self.floor_ranges)
+
+    @property
+    def buildings(self):
+        return list(self.building_ranges)
+
+    def rooms_of(self, floor = None, building:str = None):
+        """
+        Room numbers on a floor and/or in a building, in index order.
+        """
+        return [room for room in self.room_ranges
+                if (floor is None or self.room_floor[room] == floor) and (building is None or self.room_building[room] == building)]
+
+    def floor_of(self, room:str):
+        """
+        Floor of an indexed room.
+        """
+        return self.room_floor[room]
+
+    def select(self, room:str = None, floor = None, building:str = None):
+        """
+        Rows of a room, floor and/or building. Several keys are combined (e.g. a room only if it is on the given floor).
+        Unknown keys give an empty frame.
+
+        Parameters:
+        room (str): Room number.
+        floor: Floor key or label.
+        building (str): Building name.
+
+        Returns:
+        pd.DataFrame: Slice of self.df.
+        """
+        start, stop = 0, self.df.shape[0]
+        for key, ranges in ((room, self.room_ranges), (floor, self.floor_ranges), (building, self.building_ranges)):
+            if key is None:
+                continue
+            key_start, key_stop = ranges.get(key, (0, 0))
+            start, stop = max(start, key_start), min(stop, key_stop)
+        return self.df.iloc[start:max(start, stop)]
+
+    def room(self, room:str):
+        return self.select(room = room)
+
+    def floor(self, floor):
+        return self.select(floor = floor)
+
+    def building(self, building:str):
+        return self.select(building = building)
@@ -1,18 +1,64 @@
-import os, io
+import os, io, time, glob, hashlib, pickle
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 import tarfile, zipfile
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import joblib
+from schema import BUILDING_NAMES, SENSOR_DTYPES, apply_schema
+from profiling import run_step
 from sklearn.ensemble import IsolationForest
 pd.options.mode.chained_assignment = None  # default='warn'
 
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2")
+ARCHIVE_SUFFIXES = (".zip",) + TAR_SUFFIXES
+# Features, auf denen der Isolation Forest Ausreißer erkennt
+OUTLIER_FEATURES = ["CO2", "tmp", "vis", "hum", "VOC"]
+# Regeln von DataPreprocessing.validate in der Reihenfolge ihrer Prüfung. Der Reason-Code eines verworfenen Datenpunktes ist die
+# Position der ersten verletzten Regel + 1, gültige Datenpunkte haben den Code 0.
+VALIDATION_RULES = ["hum_above_100", "tmp_out_of_range", "voc_co2_ratio", "fast_rise", "zero_value", "frozen_co2"]
+# Festes Spaltenschema der .dat-Dateien für das parallele Einlesen, die Sensorwerte mit den Datentypen aus schema.py, sodass Einlesen und
+# apply_schema übereinstimmen. date_time bleibt ein String und wird erst in DataPreprocessing.convert_features umgewandelt, damit das
+# Ergebnis dem bisherigen Einlesen entspricht.
+DAT_DTYPES = {**SENSOR_DTYPES, "date_time": str}
+
 class DataExtractor:
     """Extrahiert den historischen CO2-Ampeldatensatz und erstellt ein DataFrame aus den vorliegenden Dateien"""
-    def __init__(self, first_directory, new_directory):
+    def __init__(self, first_directory, new_directory, stream:bool = False, n_jobs:int = None, store_directory:str = None):
+        """
+        Args
+            first_directory (str): Verzeichnis mit den zip-/tar-Archiven oder den entpackten .dat-Dateien.
+            new_directory (str): Verzeichnis, in das die Archive extrahiert werden.
+            stream (bool): liest die .dat-Dateien direkt aus den Archiven, wenn True. Dabei wird nichts extrahiert und nichts gelöscht.
+            n_jobs (int): Anzahl der Prozesse, mit denen get_data die .dat-Dateien parallel und mit festem Spaltenschema einliest.
+                          None oder 1 liest die Dateien nacheinander ein, -1 nutzt alle CPU-Kerne.
+            store_directory (str): Verzeichnis eines RawDataStore. Wenn gesetzt, werden nur neue oder geänderte Dateien aus
+                                   first_directory eingelesen und der gesamte Datensatz aus dem Parquet-Speicher geladen.
+        """
         self.first_directory = first_directory
         self.new_directory = new_directory
-    def create_df(self):
+        self.stream = stream
+        self.n_jobs = n_jobs
+        self.store_directory = store_directory
+        self.ingest_report = None
+    def create_df(self, columns:list = None):
         """Erstellt ein pandas.DataFrame Objekt, indem .dat Dateien ausgelesen werden. Das Auslesen erfolgt normalerweise nach einem Extrahieren der zip-Ordner,
-        da die historischen Dateien in diesem Format vorliegen. Das Auslesen kann aber auch bei entpackten Dateien erfolgen."""
+        da die historischen Dateien in diesem Format vorliegen. Das Auslesen kann aber auch bei entpackten Dateien erfolgen.
+        Im Streaming-Modus (stream = True) werden die Archive im Speicher gelesen und bleiben unverändert erhalten.
+        
+        Args:
+            columns (list): Spalten, die aus dem RawDataStore geladen werden sollen (nur mit store_directory, None lädt alle Spalten).
+        """
+        if self.store_directory is not None:
+            store = RawDataStore(self.store_directory)
+            store.update(self.first_directory, self)
+            self.df = store.load(columns = columns)
+            return self.df
+        if self.stream:
+            self.df = self.stream_data(self.first_directory)
+            return self.df
         self.extract_zip_files(self.first_directory, self.new_directory)
         self.delete_zip_files(self.first_directory)
         self.df = self.get_data(self.new_directory)
@@ -34,7 +80,7 @@ class DataExtractor:
                             print(f"Extracted {file_name} in {new_directory}")
                     except zipfile.BadZipFile as e:
                         print(f"Failed to extract {file_name}: {e}")
-                elif file_name.endswith(".tar") or file_name.endswith(".tar.gz") or file_name.endswith(".tgz") or file_name.endswith(".tar.bz2"):
+                elif file_name.endswith(TAR_SUFFIXES):
                     try:
                         with tarfile.open(file_path, 'r') as tar_ref:
                             tar_ref.extractall(new_directory)
@@ -50,7 +96,7 @@ class DataExtractor:
         for root, _, files in os.walk(directory):
             for file_name in files:
                 file_path = os.path.join(root, file_name)
-                if file_name.endswith((".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2")):
+                if file_name.endswith(ARCHIVE_SUFFIXES):
                     try:
                         os.remove(file_path)
                         print(f"File {file_name} has been deleted.")
@@ -65,23 +111,25 @@ class DataExtractor:
             df (pandas.DataFrame): ein DataFrame-Objekt, das die gelesenen Daten enthält.
         """
         dataframes = []
-        for root, _, files in os.walk(directory):
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                try:
-                    # Lese alle .dat Dateien aus, um ein DataFrame zu erstellen
-                    df = pd.read_csv(file_path, delimiter=';', 
-                                    header = 1, encoding='unicode_escape', on_bad_lines='skip')
-                    dataframes.append(df)
-                except Exception as e:
-                    print(f"Failed to read {file_name} into DataFrame: {e}")
-                    continue
+        if self.n_jobs not in (None, 1):
+            dataframes = self.get_data_parallel(directory)
+        else:
+            for root, _, files in os.walk(directory):
+                for file_name in files:
+                    file_path = os.path.join(root, file_name)
+                    try:
+                        # Lese alle .dat Dateien aus, um ein DataFrame zu erstellen
+                        df = self.read_dat_file(file_path)
+                        dataframes.append(df)
+                    except Exception as e:
+                        print(f"Failed to read {file_name} into DataFrame: {e}")
+                        continue
         # Konkateniere alle DataFrames aus dem Listobjekt 'dataframes' in ein pandas.DataFrame Objekt
         if dataframes:
             print("Read data successfully.")
             final_df = pd.concat(dataframes, ignore_index=True)
             print(f"Data contains {final_df.shape[0]} data points and {final_df.shape[1]} columns.")
-            return final_df
+            return apply_schema(final_df, verbose = True, label = "Raw data")
         else:
             print(f"No .dat files found in {self.new_directory}. \n Trying to extract files from the original directory {self.first_directory}")
             # Falls es keine Dateien zu extrahieren gab und kein neues Verzeichnis erstellt wurde, wird versucht, die Daten aus dem ursprünglichen ersten Verzeichnis zu lesen.
@@ -90,20 +138,367 @@ class DataExtractor:
             except:
                 print(f"No .dat files found in {self.first_directory}. Empty DataFrame returned.")
                 return pd.DataFrame()
+
+    def read_dat_file(self, source):
+        """Liest eine einzelne .dat-Datei in einen Pandas DataFrame ein.
+        
+        Args:
+            source (str oder file-like): Pfad zur .dat-Datei oder ein geöffnetes Dateiobjekt (z.B. ein Archiv-Member).
+        Returns:
+            df (pandas.DataFrame): ein DataFrame-Objekt, das die gelesenen Daten enthält.
+        """
+        return pd.read_csv(source, delimiter=';', 
+                           header = 1, encoding='unicode_escape', on_bad_lines='skip')
+    
+    def read_dat_file_typed(self, file_path):
+        """Liest eine einzelne .dat-Datei mit dem festen Spaltenschema DAT_DTYPES und der pyarrow-Engine ein und zählt dabei
+        die übersprungenen fehlerhaften Zeilen. Passt eine Datei nicht zum Schema, wird sie wie bisher mit read_dat_file gelesen.
+        
+        Args:
+            file_path (str): Pfad zur .dat-Datei.
+        Returns:
+            (pandas.DataFrame, dict): das DataFrame-Objekt (None bei einem Fehler) und eine Statistik mit Zeilen und fehlerhaften Zeilen.
+        """
+        bad_lines = []
+        def skip_bad_line(row):
+            bad_lines.append(row.number)
+            return "skip"
+        stats = {"file": file_path, "rows": 0, "bad_lines": None, "typed": True, "error": None}
+        try:
+            df = pd.read_csv(file_path, delimiter=';', header = 1, encoding='unicode_escape',
+                             engine="pyarrow", dtype=DAT_DTYPES, on_bad_lines=skip_bad_line)
+            stats["bad_lines"] = len(bad_lines)
+        except Exception:
+            # z.B. nicht-numerische Werte in einer Schemaspalte: wie bisher mit Typinferenz einlesen
+            stats["typed"] = False
+            try:
+                df = self.read_dat_file(file_path)
+            except Exception as e:
+                stats["error"] = str(e)
+                return None, stats
+        stats["rows"] = df.shape[0]
+        return df, stats
+    
+    def get_data_parallel(self, directory):
+        """Liest alle .dat-Dateien eines Verzeichnisses parallel in einem Prozesspool mit read_dat_file_typed ein.
+        Die Reihenfolge der DataFrames entspricht der von get_data, sodass das konkatenierte Ergebnis identisch ist.
+        Die Statistik pro Datei wird in self.ingest_report gespeichert.
+        
+        Args:
+            directory (str): Name des Verzeichnisses, aus dem die .dat-Dateien gelesen werden sollen.
+        Returns:
+            dataframes (list): Liste der eingelesenen DataFrame-Objekte.
+        """
+        file_paths = [os.path.join(root, file_name) for root, _, files in os.walk(directory) for file_name in files]
+        if not file_paths:
+            return []
+        max_workers = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        dataframes, report = [], []
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            for df, stats in executor.map(self.read_dat_file_typed, file_paths, chunksize = 4):
+                report.append(stats)
+                if df is None:
+                    print(f"Failed to read {os.path.basename(stats['file'])} into DataFrame: {stats['error']}")
+                    continue
+                dataframes.append(df)
+        self.ingest_report = pd.DataFrame(report)
+        print(self.ingest_report[["file", "rows", "bad_lines", "typed"]].to_string(index = False))
+        print(f"Read {int(self.ingest_report.rows.sum())} rows from {len(dataframes)} files, "
+              f"skipped {int(self.ingest_report.bad_lines.fillna(0).sum())} bad lines.")
+        return dataframes
+    
+    def iter_dat_files(self, directory):
+        """Durchläuft ein Verzeichnis und liefert alle lesbaren Dateien, ohne Archive zu extrahieren. Aus zip- und tar-Archiven werden
+        die .dat-Member direkt als Dateiobjekt geöffnet, alle anderen Dateien werden wie in get_data gelesen.
+        
+        Args:
+            directory (str): Name des Verzeichnisses mit den Archiven und/oder .dat-Dateien.
+        Yields:
+            (str, file-like, int, float): Pfad relativ zu directory (bei Archiven "archiv/member"), das geöffnete Dateiobjekt,
+                                          die Dateigröße in Bytes und der Zeitpunkt der letzten Änderung (Unix-Zeit).
+        """
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                file_path = os.path.join(root, file_name)
+                relative_path = os.path.relpath(file_path, directory)
+                if file_name.endswith(".zip"):
+                    try:
+                        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+                            for member in zip_ref.infolist():
+                                if member.is_dir() or not member.filename.endswith(".dat"):
+                                    continue
+                                mtime = time.mktime(member.date_time + (0, 0, -1))
+                                with zip_ref.open(member) as member_file:
+                                    yield f"{relative_path}/{member.filename}", member_file, member.file_size, mtime
+                    except zipfile.BadZipFile as e:
+                        print(f"Failed to read {file_name}: {e}")
+                elif file_name.endswith(TAR_SUFFIXES):
+                    try:
+                        with tarfile.open(file_path, 'r') as tar_ref:
+                            # Iteration statt getmembers(), damit komprimierte Archive nur einmal sequenziell gelesen werden.
+                            for member in tar_ref:
+                                if not member.isfile() or not member.name.endswith(".dat"):
+                                    continue
+                                member_file = tar_ref.extractfile(member)
+                                if member_file is not None:
+                                    yield f"{relative_path}/{member.name}", member_file, member.size, float(member.mtime)
+                    except tarfile.TarError as e:
+                        print(f"Failed to read {file_name}: {e}")
+                else:
+                    file_stat = os.stat(file_path)
+                    with open(file_path, 'rb') as file:
+                        yield relative_path, file, file_stat.st_size, file_stat.st_mtime
+    
+    def stream_data(self, directory):
+        """Liest alle .dat-Dateien direkt aus den zip- und tar-Archiven (sowie aus entpackten Dateien) in einen Pandas DataFrame ein.
+        Im Gegensatz zu extract_zip_files und get_data werden keine Dateien auf die Festplatte geschrieben und keine Archive gelöscht.
+        
+        Args:
+            directory (str): Name des Verzeichnisses mit den Archiven und/oder .dat-Dateien.
+        Returns:
+            df (pandas.DataFrame): ein DataFrame-Objekt, das die gelesenen Daten enthält.
+        """
+        dataframes = []
+        for file_name, file, _, _ in self.iter_dat_files(directory):
+            try:
+                dataframes.append(self.read_dat_file(file))
+            except Exception as e:
+                print(f"Failed to read {file_name} into DataFrame: {e}")
+                continue
+        if dataframes:
+            print("Read data successfully.")
+            final_df = pd.concat(dataframes, ignore_index=True)
+            print(f"Data contains {final_df.shape[0]} data points and {final_df.shape[1]} columns.")
+            return apply_schema(final_df, verbose = True, label = "Raw data")
+        else:
+            print(f"No .dat files found in {directory}. Empty DataFrame returned.")
+            return pd.DataFrame()
+    
+    
+class RawDataStore:
+    """Persistenter Parquet-Speicher für die Rohdaten der CO2-Ampeln, partitioniert nach Raum und Monat.
+    Ein Manifest hält Pfad (relativ zum Rohdatenverzeichnis), Größe, Änderungszeitpunkt und Hash jeder eingelesenen Datei fest, sodass bei einem erneuten Lauf
+    nur neue oder geänderte Dateien geparst werden."""
+    PARTITION_COLUMNS = ["room_number", "year_month"]
+    MANIFEST_COLUMNS = ["path", "size", "mtime", "hash", "file_id", "rows"]
+    def __init__(self, store_directory):
+        """
+        Args
+            store_directory (str): Verzeichnis des Speichers. Die Daten liegen unter 'data', das Manifest in 'manifest.csv'.
+        """
+        self.store_directory = store_directory
+        self.data_directory = os.path.join(store_directory, "data")
+        self.manifest_path = os.path.join(store_directory, "manifest.csv")
+    
+    def load_manifest(self):
+        """Lädt das Manifest der bereits eingelesenen Dateien.
+        
+        Returns:
+            manifest (pandas.DataFrame): ein DataFrame-Objekt mit den Spalten aus MANIFEST_COLUMNS, indiziert über den Pfad.
+        """
+        if not os.path.exists(self.manifest_path):
+            return pd.DataFrame(columns = self.MANIFEST_COLUMNS).set_index("path")
+        return pd.read_csv(self.manifest_path, dtype = {"path": str, "hash": str, "file_id": str}).set_index("path")
+    
+    def save_manifest(self, manifest):
+        """Speichert das Manifest. Es wird zuerst in eine temporäre Datei geschrieben, damit ein Abbruch kein halbes Manifest hinterlässt.
+        
+        Args:
+            manifest (pandas.DataFrame): ein DataFrame-Objekt, indiziert über den Pfad.
+        """
+        os.makedirs(self.store_directory, exist_ok = True)
+        temporary_path = self.manifest_path + ".tmp"
+        manifest.reset_index().to_csv(temporary_path, index = False)
+        os.replace(temporary_path, self.manifest_path)
+    
+    def update(self, directory, extractor = None):
+        """Liest alle neuen oder geänderten .dat-Dateien (auch in zip- und tar-Archiven) aus directory ein und hängt sie an den Speicher an.
+        Unveränderte Dateien (gleiche Größe und gleicher Änderungszeitpunkt bzw. gleicher Hash) werden übersprungen.
+        
+        Args:
+            directory (str): Verzeichnis mit den Archiven und/oder .dat-Dateien.
+            extractor (DataExtractor): wird zum Durchlaufen und Einlesen der Dateien verwendet.
+        Returns:
+            manifest (pandas.DataFrame): das aktualisierte Manifest.
+        """
+        if extractor is None:
+            extractor = DataExtractor(directory, None)
+        manifest = self.load_manifest()
+        new_files, changed_files, unchanged_files = 0, 0, 0
+        for relative_path, file, size, mtime in extractor.iter_dat_files(directory):
+            # Schlüssel ist der Pfad relativ zu directory, damit dasselbe Verzeichnis (relativ, absolut, mit "/" am Ende) dieselben
+            # Einträge und file_ids ergibt
+            path = relative_path.replace(os.sep, "/")
+            legacy_path = os.path.join(directory, relative_path)
+            if path not in manifest.index and legacy_path in manifest.index:
+                # Einträge älterer Manifeste mit dem zusammengesetzten Pfad übernehmen (ihre file_id bleibt erhalten)
+                manifest = manifest.rename(index = {legacy_path: path})
+            known = path in manifest.index
+            if known and manifest.at[path, "size"] == size and manifest.at[path, "mtime"] == mtime:
+                unchanged_files += 1
+                continue
+            content = file.read()
+            digest = hashlib.sha1(content).hexdigest()
+            if known and manifest.at[path, "hash"] == digest:
+                # nur der Änderungszeitpunkt hat sich geändert, der Inhalt nicht
+                manifest.at[path, "mtime"] = mtime
+                unchanged_files += 1
+                continue
+            try:
+                df = extractor.read_dat_file(io.BytesIO(content))
+            except Exception as e:
+                print(f"Failed to read {relative_path} into DataFrame: {e}")
+                continue
+            file_id = manifest.at[path, "file_id"] if known else hashlib.sha1(path.encode()).hexdigest()[:16]
+            # Fragmente einer geänderten Datei (oder eines abgebrochenen Laufs) werden ersetzt
+            self.remove_fragments(file_id)
+            self.write_fragments(df, file_id)
+            manifest.loc[path, ["size", "mtime", "hash", "file_id", "rows"]] = [size, mtime, digest, file_id, df.shape[0]]
+            if known:
+                changed_files += 1
+            else:
+                new_files += 1
+        self.save_manifest(manifest)
+        print(f"Store updated: {new_files} new, {changed_files} changed, {unchanged_files} unchanged files.")
+        return manifest
+    
+    def write_fragments(self, df, file_id):
+        """Schreibt die Daten einer Datei partitioniert nach Raum und Monat in den Speicher. Alle Fragmente einer Datei tragen deren file_id im Namen.
+        
+        Args:
+            df (pandas.DataFrame): die eingelesenen Rohdaten einer Datei.
+            file_id (str): eindeutige Kennung der Quelldatei.
+        """
+        if df.empty:
+            return
+        df = df.copy()
+        room_number = df["device_id"].astype(str).str.split("-").str[-1] if "device_id" in df.columns else None
+        df["room_number"] = room_number if room_number is not None else "unknown"
+        year_month = pd.to_datetime(df["date_time"], errors = "coerce").dt.strftime("%Y-%m") if "date_time" in df.columns else None
+        df["year_month"] = year_month if year_month is not None else "unknown"
+        df[self.PARTITION_COLUMNS] = df[self.PARTITION_COLUMNS].fillna("unknown")
+        table = pa.Table.from_pandas(df, preserve_index = False)
+        # Einheitliches Schema über alle Fragmente: Zahlen als float64, alles andere als String
+        fields = [pa.field(field.name, pa.float64() if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) else pa.string())
+                  for field in table.schema]
+        table = table.cast(pa.schema(fields)).replace_schema_metadata(None)
+        pq.write_to_dataset(table, self.data_directory, partition_cols = self.PARTITION_COLUMNS,
+                            basename_template = file_id + "-{i}.parquet", existing_data_behavior = "overwrite_or_ignore")
+    
+    def remove_fragments(self, file_id):
+        """Löscht alle Fragmente einer Quelldatei aus dem Speicher.
+        
+        Args:
+            file_id (str): eindeutige Kennung der Quelldatei.
+        """
+        for fragment in glob.glob(os.path.join(self.data_directory, "**", f"{file_id}-*.parquet"), recursive = True):
+            os.remove(fragment)
+    
+    def load(self, columns:list = None, rooms:list = None, months:list = None):
+        """Lädt die Rohdaten aus dem Speicher. Es werden nur die angeforderten Spalten und Partitionen gelesen.
+        
+        Args:
+            columns (list): Spalten, die gelesen werden sollen. None liest alle Rohdatenspalten (ohne Partitionsspalten).
+            rooms (list): Räume (z.B. ["e001", "eu02"]), die gelesen werden sollen. None liest alle Räume.
+            months (list): Monate im Format "YYYY-MM", die gelesen werden sollen. None liest alle Monate.
+        Returns:
+            df (pandas.DataFrame): ein DataFrame-Objekt mit den Rohdaten.
+        """
+        if not os.path.isdir(self.data_directory):
+            print(f"No data found in {self.store_directory}. Empty DataFrame returned.")
+            return pd.DataFrame()
+        filters = []
+        if rooms is not None:
+            filters.append(("room_number", "in", list(rooms)))
+        if months is not None:
+            filters.append(("year_month", "in", list(months)))
+        df = pd.read_parquet(self.data_directory, columns = columns, filters = filters or None)
+        for col in self.PARTITION_COLUMNS:
+            if col in df.columns:
+                if columns is None:
+                    df = df.drop(columns = [col])
+                else:
+                    df[col] = df[col].astype(str)
+        print(f"Data contains {df.shape[0]} data points and {df.shape[1]} columns.")
+        return apply_schema(df, verbose = True, label = "Raw data")
+    
+    def list_partitions(self):
+        """Listet alle Partitionen des Speichers auf, sortiert nach Raum und Monat.
+        
+        Returns:
+            partitions (list): Liste von (Raum, Monat)-Tupeln.
+        """
+        partitions = []
+        if not os.path.isdir(self.data_directory):
+            return partitions
+        for room_directory in sorted(os.listdir(self.data_directory)):
+            room_path = os.path.join(self.data_directory, room_directory)
+            if not room_directory.startswith("room_number=") or not os.path.isdir(room_path):
+                continue
+            for month_directory in sorted(os.listdir(room_path)):
+                if month_directory.startswith("year_month="):
+                    partitions.append((room_directory.split("=", 1)[1], month_directory.split("=", 1)[1]))
+        return partitions
     
+    def iter_partitions(self, columns:list = None, by:str = "month"):
+        """Liest den Speicher Partition für Partition, sodass nie mehr als eine Partition im Speicher liegt.
+        
+        Args:
+            columns (list): Spalten, die gelesen werden sollen. None liest alle Rohdatenspalten.
+            by (str): "month" liefert einen Monat eines Raumes pro Schritt, "room" alle Monate eines Raumes.
+        Yields:
+            (str, pandas.DataFrame): Raum und die Rohdaten der Partition, Räume und Monate in aufsteigender Reihenfolge.
+        """
+        if by not in ("month", "room"):
+            raise ValueError(f"by must be 'month' or 'room', got {by}")
+        partitions = self.list_partitions()
+        rooms = list(dict.fromkeys(room for room, _ in partitions))
+        for room in rooms:
+            months = [month for partition_room, month in partitions if partition_room == room]
+            chunks = [months] if by == "room" else [[month] for month in months]
+            for chunk in chunks:
+                df = pd.read_parquet(self.data_directory, columns = columns,
+                                     filters = [("room_number", "=", room), ("year_month", "in", chunk)])
+                yield room, df.drop(columns = [col for col in self.PARTITION_COLUMNS if col in df.columns and (columns is None or col not in columns)])
     
+
 class DataPreprocessing:
     """Führt ein Preprocessing auf den CO2-Ampeldaten durch."""
-    def __init__(self, get_outliers_out = True, roll:bool = True, date_time_column:str = "date_time"):
+    def __init__(self, get_outliers_out = True, roll:bool = True, date_time_column:str = "date_time", n_jobs:int = 1,
+                 outlier_model_path:str = None, outlier_group:str = None, max_fit_samples:int = 100000, random_state:int = None,
+                 profiler = None, diff_features:list = None):
         """
         Args
             get_outliers_out (bool): Ausreißer entfernen, wenn True, sonst nicht.
             roll (bool): erstellt rolling windows für die Daten, wenn True, sonst nicht.
             date_time_column (str): der Spaltenname in den Daten, der die Datums- und Zeitinformationen enthält.
+            n_jobs (int): Anzahl der Prozesse für die raumweisen Schritte in preprocess_df (bzw. Threads für die Ausreißerbewertung).
+                          1 rechnet seriell, -1 nutzt alle CPU-Kerne.
+            outlier_model_path (str): Datei, in der die trainierten Isolation Forests gespeichert werden. Existiert sie, werden die
+                                      Modelle geladen statt neu trainiert (z.B. für spätere und inkrementelle Läufe).
+            outlier_group (str): "room_number" oder "building_name" trainiert ein Modell pro Raum bzw. Gebäude, None ein globales Modell.
+            max_fit_samples (int): maximale Anzahl an Datenpunkten, auf denen ein Isolation Forest trainiert wird (zufällige Stichprobe).
+            random_state (int): Seed für die Stichprobe und den Isolation Forest.
+            profiler (profiling.StepProfiler): misst Laufzeit, Zeilen und Speicher jedes Schritts von preprocess_df. None (Standard)
+                                               schaltet die Messung ab.
+            diff_features (list): Features, für die create_temporal_features die Änderung zum vorherigen Datenpunkt des Raumes
+                                  (<feature>_diff) und die Änderungsrate pro Sekunde (<feature>_diff_per_sec) berechnet. Standard: ["tmp"].
         """
         self.get_outliers_out = get_outliers_out
         self.roll = roll
         self.date_time_column = date_time_column
+        self.n_jobs = n_jobs
+        self.outlier_model_path = outlier_model_path
+        self.outlier_group = outlier_group
+        self.max_fit_samples = max_fit_samples
+        self.random_state = random_state
+        self.profiler = profiler
+        self.diff_features = ["tmp"] if diff_features is None else list(diff_features)
+        self.isoforest = None
+        # Verworfene Datenpunkte pro Raum und Regel aus dem letzten Aufruf von remove_invalid_values
+        self.validation_report = None
+        # Zustand für preprocess_increment
+        self.state = None
     def preprocess_df(self, df, rolling_window:str, sample_time:str = "60min"):
         """Allgemeine Methode zur Durchführung der Vorverarbeitungsschritte für einen gegebenen Datenrahmen df.
         Args
@@ -119,29 +514,272 @@ class DataPreprocessing:
             df[["WIFI", "BLE"]].fillna(value = 0, inplace = True)
         except:
             pass
-        df = self.drop_na_rows(df)
-        df = self.convert_features(df)
+        # run_step ruft den Schritt direkt auf, wenn kein Profiler gesetzt ist
+        df = run_step(self.profiler, self.drop_na_rows, df)
+        df = run_step(self.profiler, self.convert_features, df)
         if self.get_outliers_out:
-            df = self.remove_outliers(df)
-        df = self.extract_room_and_building(df)
-        df = self.remove_duplicates(df)
-        df = self.remove_features(df)
-        df = self.remove_invalid_values(df)
-        df = self.create_rolling_windows(df, rolling_window = rolling_window, sample_time = sample_time)
-        df = self.create_time_diff_features(df)
-        df = self.create_average_differentials(df)
-        df = self.create_new_features(df)
-        df = self.fill_na(df)
+            df = run_step(self.profiler, self.remove_outliers, df)
+        df = run_step(self.profiler, self.extract_room_and_building, df)
+        df = run_step(self.profiler, self.remove_duplicates, df)
+        df = run_step(self.profiler, self.remove_features, df)
+        df = run_step(self.profiler, self.remove_invalid_values, df)
+        if self.n_jobs not in (None, 1):
+            # die Teilschritte laufen in den Worker-Prozessen und werden als ein Schritt gemessen
+            df = run_step(self.profiler, self.preprocess_rooms_parallel, df, rolling_window = rolling_window, sample_time = sample_time)
+        else:
+            df = self.preprocess_rooms(df, rolling_window = rolling_window, sample_time = sample_time)
+        # fehlende Werte wurden bereits raumweise in create_temporal_features aufgefüllt (ein Durchlauf von fill_na)
         if self.date_time_column in df.columns:
-            df = df.sort_values([self.date_time_column])
+            # Sortierung nach Zeit und Raum, damit die Reihenfolge unabhängig vom seriellen oder parallelen Pfad eindeutig ist
+            df = df.sort_values([self.date_time_column, "room_number"], kind = "stable")
             # Setze Index zurück, der zu diesem Zeitpunkt aus normalen int-Werten besteht. Da vorhin Datenpunkte entfernt wurden, gab es
             # Lücken zwischen den Indexwerten (z.B. 1,3,7 etc. --> 1,2,3)
             df = df.reset_index(drop = True)
         else:
             # falls 'date_time_column' den Index bildet.
             df = df.sort_index()
+        # Nach dem Zusammenführen der Räume die kompakten Datentypen wiederherstellen
+        return apply_schema(df)
+    
+    def preprocess_rooms(self, df, rolling_window:str, sample_time:str = "60min"):
+        """Führt die raumweise unabhängigen Schritte (Rolling Windows, zeitliche Features und neue Features) aus.
+        
+        Args
+            df (pandas.DataFrame): die bereinigten Daten eines oder mehrerer Räume.
+            rolling_window (str): die Größe des rollenden Fensters (z.B. '1s', '1min', '1h').
+            sample_time (str): die Größe, die für das Resampling verwendet wird.
+        Rückgabe
+            df (pandas.DataFrame): DataFrame Objekt.
+        """
+        df = run_step(self.profiler, self.create_rolling_windows, df, rolling_window = rolling_window, sample_time = sample_time)
+        df = run_step(self.profiler, self.create_temporal_features, df)
+        df = run_step(self.profiler, self.create_new_features, df)
+        return df
+    
+    def preprocess_rooms_parallel(self, df, rolling_window:str, sample_time:str = "60min"):
+        """Verteilt die Räume in höchstens n_jobs Gruppen (höchstens eine pro verfügbarem CPU-Kern) auf einen Prozesspool und führt
+        preprocess_rooms pro Gruppe aus. Die Ergebnisse werden in der Reihenfolge des ersten Auftretens der Räume zusammengeführt, sodass
+        preprocess_df dasselbe Ergebnis wie im seriellen Pfad liefert. Steht nur ein Kern zur Verfügung, wird seriell gerechnet.
+        
+        Args
+            df (pandas.DataFrame): die bereinigten Daten aller Räume.
+            rolling_window (str): die Größe des rollenden Fensters (z.B. '1s', '1min', '1h').
+            sample_time (str): die Größe, die für das Resampling verwendet wird.
+        Rückgabe
+            df (pandas.DataFrame): DataFrame Objekt.
+        """
+        max_workers = available_cpus() if self.n_jobs == -1 else min(self.n_jobs, available_cpus())
+        room_codes = pd.factorize(df.room_number)[0] if "room_number" in df.columns else np.zeros(0)
+        if max_workers <= 1 or room_codes.size == 0 or room_codes.max() == 0:
+            # mit nur einem Prozess oder Raum wäre der Prozesspool reiner Mehraufwand
+            return self.preprocess_rooms(df, rolling_window = rolling_window, sample_time = sample_time)
+        shards = self.room_shards(df, room_codes, max_workers)
+        # Die Worker erhalten nur die Konfiguration, nicht das trainierte Modell, den Zustand oder Berichte dieses Objekts
+        config = {"get_outliers_out": self.get_outliers_out, "roll": self.roll, "date_time_column": self.date_time_column,
+                  "diff_features": self.diff_features}
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            results = list(executor.map(partial(preprocess_room_shard, config, rolling_window = rolling_window, sample_time = sample_time),
+                                        shards))
+        return pd.concat(results)
+    
+    @staticmethod
+    def room_shards(df, room_codes, n_shards:int):
+        """Teilt die Räume in der Reihenfolge ihres ersten Auftretens in höchstens n_shards zusammenhängende Gruppen mit möglichst
+        gleich vielen Datenpunkten auf.
+        
+        Args
+            df (pandas.DataFrame): die Daten aller Räume.
+            room_codes (numpy.ndarray): Code des Raumes jeder Zeile (pd.factorize der room_number).
+            n_shards (int): maximale Anzahl der Gruppen.
+        Rückgabe
+            shards (list): eine DataFrame pro Gruppe.
+        """
+        room_sizes = np.bincount(room_codes)
+        # Gruppe jedes Raumes anhand des Anteils der Datenpunkte vor ihm
+        boundaries = np.concatenate([[0], np.cumsum(room_sizes)[:-1]])
+        room_shard = np.minimum(boundaries * n_shards // room_sizes.sum(), n_shards - 1)
+        row_shard = room_shard[room_codes]
+        return [df[row_shard == shard] for shard in np.unique(room_shard)]
+    
+    def preprocess_increment(self, df, rolling_window:str, sample_time:str = "60min", finalize:bool = False):
+        """Inkrementelle Variante von preprocess_df für tägliche Batches. Es werden nur die neuen Rohdaten df verarbeitet. Der Zustand aus
+        dem vorherigen Lauf (self.state) liefert pro Raum die letzten Zeitstempel, das Ende der Rolling Windows und die letzten Werte für diff().
+        Zurückgegeben werden nur die neu abgeschlossenen Datenpunkte. Sie stimmen mit den entsprechenden Zeilen einer vollständigen
+        Neuberechnung mit preprocess_df überein, solange die Batches zeitlich aufeinander folgen und sample_time einen Tag ganzzahlig teilt.
+        Das jeweils letzte (evtl. noch unvollständige) Resampling-Intervall eines Raumes wird zurückgehalten und im nächsten Lauf ausgegeben.
+        Der Isolation Forest wird im ersten Lauf trainiert (oder aus outlier_model_path geladen) und danach nur noch zur Bewertung der neuen Datenpunkte verwendet.
+        
+        Args
+            df (pandas.DataFrame): die neuen Rohdaten (z.B. aus DataExtractor.create_df).
+            rolling_window (str): die Größe des rollenden Fensters (z.B. '1s', '1min', '1h').
+            sample_time (str): die Größe, die für das Resampling verwendet wird.
+            finalize (bool): gibt auch das letzte Intervall jedes Raumes aus, wenn True (z.B. am Ende der Datenreihe), auch für Räume
+                             ohne Datenpunkte in df und bei einem leeren Batch.
+        Rückgabe
+            df (pandas.DataFrame): die neu abgeschlossenen, vorverarbeiteten Datenpunkte.
+        """
+        if getattr(self, "state", None) is None:
+            self.state = {"rolling_window": rolling_window, "sample_time": sample_time, "roll": self.roll,
+                          "isoforest": None, "validation": {}, "rooms": {}}
+        state = self.state
+        if (state["rolling_window"], state["sample_time"], state["roll"]) != (rolling_window, sample_time, self.roll):
+            raise ValueError("rolling_window, sample_time and roll must not change between incremental runs.")
+        sample_delta = pd.Timedelta(sample_time)
+        window_delta = pd.Timedelta(rolling_window)
+        
+        df = self.drop_na_rows(df)
+        df = self.convert_features(df)
+        if self.get_outliers_out:
+            df = self.remove_outliers(df, isoforest = state["isoforest"])
+            state["isoforest"] = self.isoforest
+        df = self.extract_room_and_building(df)
+        df = self.remove_duplicates(df)
+        # Duplikate aus vorherigen Läufen und verspätete Datenpunkte (vor dem zurückgehaltenen Intervall) entfernen
+        open_buckets = {room: room_state["open_bucket"] for room, room_state in state["rooms"].items()}
+        open_bucket = pd.to_datetime(df.room_number.map(open_buckets))
+        late = (df[self.date_time_column] < open_bucket).to_numpy()
+        known = np.zeros(df.shape[0], dtype = bool)
+        for room, room_state in state["rooms"].items():
+            is_room = (df.room_number == room).to_numpy()
+            known[is_room] = df.loc[is_room, self.date_time_column].isin(room_state["keys"]).to_numpy()
+        if late.any():
+            print(f"Dropped {int(late.sum())} late data points that belong to already finalized intervals.")
+        df = df[~(late | known)]
+        df = self.remove_features(df)
+        df = self.remove_invalid_values(df, carry = state["validation"])
+        
+        rooms = list(df.room_number.unique())
+        if finalize:
+            # auch Räume ohne Datenpunkte in diesem Batch geben ihr zurückgehaltenes Intervall aus
+            rooms += [room for room in state["rooms"] if room not in rooms]
+        tails = [state["rooms"][room]["tail"] for room in rooms if room in state["rooms"]]
+        combined = pd.concat(tails + [df], ignore_index = True) if tails else df
+        if combined.empty:
+            return combined
+        
+        last_time = combined.groupby("room_number", observed = True)[self.date_time_column].max()
+        if self.roll:
+            result = self.create_rolling_windows(combined, rolling_window = rolling_window, sample_time = sample_time)
+            new_open_bucket = last_time.dt.floor(sample_time)
+            if finalize:
+                new_open_bucket = new_open_bucket + sample_delta
+        else:
+            result = combined.set_index(self.date_time_column)
+            new_open_bucket = last_time + pd.Timedelta(1, "ns")
+        
+        # nur Intervalle ausgeben, die im vorherigen Lauf noch nicht abgeschlossen waren und in diesem Lauf abgeschlossen sind
+        labels = pd.Series(result.index, index = result.index)
+        lower = pd.to_datetime(result.room_number.map(open_buckets))
+        upper = pd.to_datetime(result.room_number.map(new_open_bucket))
+        is_new = ((labels >= lower) | lower.isna()) & (labels < upper)
+        result = result[is_new.to_numpy()]
+        
+        # Zustand pro Raum aktualisieren
+        raw_keys = {room: keys for room, keys in df.groupby("room_number", observed = True)[self.date_time_column]}
+        for room in rooms:
+            room_state = state["rooms"].get(room, {"keys": pd.Series(dtype = "datetime64[ns]"), "last_row": None})
+            room_state["open_bucket"] = new_open_bucket[room]
+            room_df = combined[combined.room_number == room]
+            cutoff = (new_open_bucket[room] - window_delta).floor(sample_time) if self.roll else new_open_bucket[room]
+            room_state["tail"] = room_df[room_df[self.date_time_column] >= cutoff]
+            keys = pd.concat([room_state["keys"], raw_keys.get(room, pd.Series(dtype = "datetime64[ns]"))])
+            room_state["keys"] = keys[keys >= new_open_bucket[room]]
+            state["rooms"][room] = room_state
+        
+        if result.empty:
+            return result.reset_index()
+        result = result.reset_index()
+        # Der letzte ausgegebene Datenpunkt jedes Raumes dient als Vorgänger für die zeitlichen Differenzen.
+        carry_rows = [state["rooms"][room]["last_row"] for room in result.room_number.unique() if state["rooms"][room]["last_row"] is not None]
+        result["_carry"] = False
+        if carry_rows:
+            result = pd.concat([result] + carry_rows, ignore_index = True)
+        # Auffüllen erst nach create_new_features, damit die Vorgänger-Zeilen keine Werte an die neuen Datenpunkte weitergeben
+        result = self.create_temporal_features(result, fill = False)
+        result = result[~result["_carry"].astype(bool)]
+        for room, room_df in result.groupby("room_number", observed = True):
+            last_row = room_df.sort_values(self.date_time_column).iloc[-1:][[self.date_time_column, "room_number"] + self.diff_features]
+            state["rooms"][room]["last_row"] = last_row.assign(_carry = True)
+        result = result.drop(columns = ["_carry"])
+        result = self.create_new_features(result)
+        result = self.fill_na(result)
+        result = result.sort_values([self.date_time_column, "room_number"], kind = "stable")
+        result = result.reset_index(drop = True)
+        return apply_schema(result)
+    
+    def preprocess_partitioned(self, partitions, rolling_window:str, sample_time:str = "60min", output_directory:str = "preprocessed_data"):
+        """Out-of-core Variante von preprocess_df. Die Rohdaten werden Partition für Partition (ein Raum oder ein Monat eines Raumes)
+        mit preprocess_increment verarbeitet und die Ergebnisse direkt als Parquet-Dateien geschrieben. Der Speicherbedarf wird damit
+        durch die größte Partition begrenzt und nicht durch den gesamten Datensatz. Die Zustände eines Raumes werden nach seiner letzten
+        Partition verworfen. Im Unterschied zu preprocess_df werden die Differenzen der Plausibilitätsprüfung nur innerhalb eines Raumes gebildet.
+        Mit outlier_group = "room_number" wird pro Raum ein Isolation Forest trainiert, sonst das Modell der ersten Partition (bzw. aus
+        outlier_model_path) für alle Partitionen verwendet.
+        
+        Args
+            partitions (iterable): (Raum, DataFrame)-Tupel, nach Raum gruppiert und je Raum zeitlich aufsteigend (z.B. RawDataStore.iter_partitions()).
+            rolling_window (str): die Größe des rollenden Fensters (z.B. '1s', '1min', '1h').
+            sample_time (str): die Größe, die für das Resampling verwendet wird.
+            output_directory (str): Verzeichnis, in das die vorverarbeiteten Daten geschrieben werden.
+        Rückgabe
+            files (list): Pfade der geschriebenen Parquet-Dateien (lesbar mit read_partitioned).
+        """
+        os.makedirs(output_directory, exist_ok = True)
+        self.state = None
+        files = []
+        iterator = iter(partitions)
+        current = next(iterator, None)
+        while current is not None:
+            room, chunk = current
+            following = next(iterator, None)
+            # Die letzte Partition eines Raumes schließt auch das letzte Intervall ab.
+            last_of_room = following is None or following[0] != room
+            result = self.preprocess_increment(chunk, rolling_window, sample_time, finalize = last_of_room)
+            del chunk
+            if not result.empty:
+                path = os.path.join(output_directory, f"part-{len(files):05d}.parquet")
+                result.to_parquet(path, index = False)
+                files.append(path)
+            if last_of_room:
+                self.state["rooms"].clear()
+                self.state["validation"].clear()
+            current = following
+        print(f"Wrote {len(files)} files to {output_directory}.")
+        return files
+    
+    @staticmethod
+    def read_partitioned(output_directory:str, columns:list = None):
+        """Liest die Ergebnisse von preprocess_partitioned und sortiert sie wie preprocess_df nach der Zeit.
+        
+        Args
+            output_directory (str): Verzeichnis mit den vorverarbeiteten Daten.
+            columns (list): Spalten, die gelesen werden sollen. None liest alle Spalten.
+        Rückgabe
+            df (pandas.DataFrame): das vorverarbeitete DataFrame-Objekt.
+        """
+        df = pd.read_parquet(output_directory, columns = columns)
+        if "date_time" in df.columns:
+            df = df.sort_values(["date_time", "room_number"], kind = "stable").reset_index(drop = True)
         return df
     
+    def save_state(self, path:str):
+        """Speichert den Zustand des inkrementellen Modus (siehe preprocess_increment) in einer Datei.
+        
+        Args:
+            path (str): Pfad der Zustandsdatei.
+        """
+        with open(path, "wb") as file:
+            pickle.dump(self.state, file)
+    
+    def load_state(self, path:str):
+        """Lädt den Zustand des inkrementellen Modus (siehe preprocess_increment) aus einer Datei.
+        
+        Args:
+            path (str): Pfad der Zustandsdatei.
+        """
+        with open(path, "rb") as file:
+            self.state = pickle.load(file)
+        return self.state
+    
     def drop_na_rows(self, df):
         """Zeilen entfernen, in denen mehr als 90% der Spalten eines Datenpunktes keinen gültigen Wert aufweisen.
         
@@ -159,29 +797,108 @@ class DataPreprocessing:
     
         return df
     
-    def remove_outliers(self, df, contamination:float = 0.075):
-            """Entferne Ausreißer mit einem Isolation Forest.
+    def remove_outliers(self, df, contamination:float = 0.075, isoforest = None):
+            """Entferne Ausreißer mit einem Isolation Forest. Das Modell wird auf einer Stichprobe von höchstens max_fit_samples Datenpunkten
+            trainiert (bzw. aus outlier_model_path geladen) und bewertet anschließend alle Datenpunkte in einem einzigen, parallelen Durchlauf.
         
         Args:
             df (pandas.DataFrame): DataFrame Objekt.
             contamination (float): relativer Anteil des Datensatzes, der als Ausreißer entfernt werden soll.
+            isoforest (IsolationForest oder dict): bereits trainierter Isolation Forest (bzw. ein dict mit einem Modell pro Raum/Gebäude,
+                                                  wenn outlier_group gesetzt ist). Wenn gesetzt, wird kein neues Modell trainiert.
         Returns:
             df (pandas.DataFrame): DataFrame Objekt.
         """
-            # n_estimators: wie viele Bäume sollen genutzt werden?
-            # contamination: welcher relativer Anteil des Datensatzes soll als Ausreißer detektiert werden?
-            # max_samples: mit wie vielen Datenpunkten soll der IsolationForest trainiert werden?
-            isoforest = IsolationForest(n_estimators = 100, contamination = contamination, max_samples = int(df.shape[0]*0.8))
-            # Isolation Forest auf den wichtigsten numerischen Werten durchführen (CO2, tmp, vis, hum und VOC).
-            prediction = isoforest.fit_predict(df[["CO2", "tmp", "vis", "hum", "VOC"]])
-            print("Number of outliers detected: {}".format(prediction[prediction < 0].sum()))
-            print("Number of normal samples detected: {}".format(prediction[prediction >= 0].sum()))
-            score = isoforest.decision_function(df[["CO2", "tmp", "vis", "hum", "VOC"]])
+            if isoforest is None:
+                isoforest = self.load_outlier_model()
+            features = df[OUTLIER_FEATURES]
+            changed = False
+            if self.outlier_group is None:
+                if isoforest is None:
+                    isoforest = self.fit_outlier_model(features, contamination = contamination)
+                    changed = True
+                score = self.score_outliers(features, isoforest)
+            else:
+                # ein Modell pro Raum bzw. Gebäude, fehlende Modelle werden nachtrainiert
+                isoforest = dict(isoforest or {})
+                score = np.empty(df.shape[0])
+                for group, positions in self.outlier_group_keys(df).groupby(level = 0, dropna = False).indices.items():
+                    if group not in isoforest:
+                        isoforest[group] = self.fit_outlier_model(features.iloc[positions], contamination = contamination)
+                        changed = True
+                    score[positions] = self.score_outliers(features.iloc[positions], isoforest[group])
+            self.isoforest = isoforest
+            if changed and self.outlier_model_path is not None:
+                joblib.dump(isoforest, self.outlier_model_path)
+            print("Number of outliers detected: {}".format(int((score < 0).sum())))
+            print("Number of normal samples detected: {}".format(int((score >= 0).sum())))
             df["anomaly_score"] = score
             # Zeilen mit anomaly_score < 0 werden vom Isolation Forest als Ausreißer interpretiert.
             df = df[df.anomaly_score >= 0]
             return df
     
+    def fit_outlier_model(self, features, contamination:float = 0.075):
+        """Trainiert einen Isolation Forest auf einer zufälligen Stichprobe von höchstens max_fit_samples Datenpunkten.
+        
+        Args:
+            features (pandas.DataFrame): die Features aus OUTLIER_FEATURES.
+            contamination (float): relativer Anteil des Datensatzes, der als Ausreißer erkannt werden soll.
+        Returns:
+            isoforest (IsolationForest): das trainierte Modell.
+        """
+        if self.max_fit_samples is not None and features.shape[0] > self.max_fit_samples:
+            features = features.sample(n = self.max_fit_samples, random_state = self.random_state)
+        # n_estimators: wie viele Bäume sollen genutzt werden?
+        # contamination: welcher relativer Anteil des Datensatzes soll als Ausreißer detektiert werden?
+        # max_samples: mit wie vielen Datenpunkten soll jeder Baum trainiert werden?
+        isoforest = IsolationForest(n_estimators = 100, contamination = contamination, max_samples = max(1, int(features.shape[0]*0.8)),
+                                    random_state = self.random_state)
+        return isoforest.fit(features.to_numpy())
+    
+    def score_outliers(self, features, isoforest, chunk_size:int = 50000):
+        """Berechnet den anomaly_score (decision_function) aller Datenpunkte in Blöcken, die parallel in Threads bewertet werden.
+        
+        Args:
+            features (pandas.DataFrame): die Features aus OUTLIER_FEATURES.
+            isoforest (IsolationForest): das trainierte Modell.
+            chunk_size (int): Anzahl der Datenpunkte pro Block.
+        Returns:
+            score (numpy.ndarray): anomaly_score pro Datenpunkt. Werte < 0 sind Ausreißer.
+        """
+        values = features.to_numpy()
+        if values.shape[0] <= chunk_size or self.n_jobs in (None, 1):
+            return isoforest.decision_function(values)
+        chunks = np.array_split(values, int(np.ceil(values.shape[0] / chunk_size)))
+        scores = joblib.Parallel(n_jobs = self.n_jobs, prefer = "threads")(joblib.delayed(isoforest.decision_function)(chunk) for chunk in chunks)
+        return np.concatenate(scores)
+    
+    def outlier_group_keys(self, df):
+        """Ermittelt pro Datenpunkt den Raum bzw. das Gebäude für die Ausreißermodelle (outlier_group). Da remove_outliers vor
+        extract_room_and_building läuft, werden die Werte bei Bedarf aus device_id abgeleitet.
+        
+        Args:
+            df (pandas.DataFrame): DataFrame Objekt.
+        Returns:
+            keys (pandas.Series): Raum bzw. Gebäude pro Datenpunkt als Index (für groupby(level = 0)).
+        """
+        if self.outlier_group in df.columns:
+            keys = df[self.outlier_group]
+        else:
+            keys = df["device_id"].str.split("-").str[-1]
+            if self.outlier_group == "building_name":
+                keys = keys.str.replace(r'\d+', '', regex = True).replace(BUILDING_NAMES)
+        return pd.Series(np.arange(df.shape[0]), index = keys.to_numpy())
+    
+    def load_outlier_model(self):
+        """Lädt die gespeicherten Isolation Forests aus outlier_model_path, falls vorhanden.
+        
+        Returns:
+            isoforest (IsolationForest, dict oder None): das geladene Modell bzw. die Modelle pro Raum/Gebäude.
+        """
+        if self.outlier_model_path is None or not os.path.exists(self.outlier_model_path):
+            return None
+        return joblib.load(self.outlier_model_path)
+    
     def convert_features(self, df):
         """Korrekte Formatierung von Dateitypen von bestimmten Features.
         
@@ -200,7 +917,7 @@ class DataPreprocessing:
                 pass
         if "snr" in df.columns:
             try:
-                df["snr"] = df["snr"].astype("float")
+                df["snr"] = df["snr"].astype(SENSOR_DTYPES["snr"])
             except Exception as e:
                 print(e)
                 pass
@@ -217,14 +934,8 @@ class DataPreprocessing:
         try:
             df.loc[:, "room_number"] = df["device_id"].str.split("-").str[-1]
             df.loc[:, "building_name"] = df["room_number"].str.replace(r'\d+', '', regex = True)
-            building_dict = {"ama":"am","amb":"am", 
-                                "ba":"b", "bb":"b",
-                                "eu":"e",
-                                "fa":"f","fu":"f",
-                                "lia":"li","lib":"li","lie":"li","liu":"li",
-                                "mu":"m"}
-            
-            df.replace({"building_name": building_dict}, inplace = True)
+            df.replace({"building_name": BUILDING_NAMES}, inplace = True)
+            df = apply_schema(df)
         
         except Exception as e:
             print(e)
@@ -260,37 +971,115 @@ class DataPreprocessing:
         
         return df
     
-    def remove_invalid_values(self, df):
-        """Entfernt ungültige Datenpunkte aus dem Datensatz.
+    def validate(self, df, carry:dict = None):
+        """Prüft alle Regeln aus VALIDATION_RULES in einem vektorisierten Durchlauf, ohne den DataFrame zwischendurch zu filtern.
+        Die Differenzen der Regeln fast_rise und frozen_co2 werden wie beim schrittweisen Filtern nur über die Datenpunkte gebildet,
+        die alle vorherigen Regeln erfüllen.
         
         Args:
             df (pandas.DataFrame): DataFrame Objekt.
+            carry (dict): Zustand für den inkrementellen Modus. Enthält die letzten Datenpunkte des vorherigen Laufs, die für die
+                          Differenzen als Vorgänger dienen, und wird mit den letzten Datenpunkten dieses Laufs aktualisiert.
         Returns:
-            df (pandas.DataFrame): DataFrame Objekt.
+            reasons (numpy.ndarray): int8-Array mit einem Reason-Code pro Zeile (0 = gültig, sonst Position in VALIDATION_RULES + 1).
         """
+        reasons = np.zeros(df.shape[0], dtype = np.int8)
+        def reject(code, invalid):
+            reasons[(reasons == 0) & invalid] = code
+        co2, voc, tmp, hum = (df[col].to_numpy() for col in ["CO2", "VOC", "tmp", "hum"])
         # hum beschreibt die relative Luftfeuchtigkeit in %. Daher sind Werte über 100% ungültig.
-        df = df[df.hum <= 100]
+        reject(1, ~(hum <= 100))
         # Die Temperatur wird in °C gemessen. Daher gehen wir davon aus, dass es keine Raumtemperaturen über 50°C geben kann. 
         # Auch wegen des Frostschutzes der Heizkörper sollte die Temperatur nicht unter 10°C liegen.
-        
-        df = df[(df.tmp <= 50) & (df.tmp >= 10)]
+        reject(2, ~((tmp <= 50) & (tmp >= 10)))
         # Der VOC-Wert ist in der Regel etwa gleich hoch oder höchstens sechsmal höher als der CO2-Wert. 
         # Einige Ausreißer geben ein Verhältnis von 156:1 an, was nicht plausibel ist.
-        df = df[(df.VOC/df.CO2) < 10]
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            reject(3, ~((voc / co2) < 10))
         # Datenpunkte mit verdächtig großen Wertänderungen bei VOC und CO2 über einen kurzen Zeitraum (60 Sekunden) entfernen
-        too_fast_VOC_rise = (df.VOC.diff() >= 1000) & (df[self.date_time_column].diff().dt.seconds < 60)
-        too_fast_CO2_rise = (df.CO2.diff() >= 1000) & (df[self.date_time_column].diff().dt.seconds < 60)
-        suspicious_rises = too_fast_VOC_rise | too_fast_CO2_rise
-        # Filtere den DataFrame
-        df = df[~suspicious_rises]
+        rows = np.flatnonzero(reasons == 0)
+        diffs = self.predecessor_diffs(df, rows, ["VOC", "CO2", self.date_time_column], carry, "rise")
+        # Wie Series.dt.seconds: Sekundenanteil der Zeitdifferenz (ohne Tage)
+        time_diff = diffs[self.date_time_column].astype("m8[ns]")
+        seconds = (time_diff.view(np.int64) // 10**9) % 86400
+        short = ~np.isnat(time_diff) & (seconds < 60)
+        reasons[rows[((diffs["VOC"] >= 1000) | (diffs["CO2"] >= 1000)) & short]] = 4
         # Der Datensatz enthält Datenpunkte mit mehreren Nullen. Wir gehen davon aus, dass diese von falschen Messwerten oder Rücksetzungen der Sensorgeräte herrühren könnten.
-        df = df[(df.CO2 != 0) & (df.VOC != 0) & (df.tmp != 0) & (df.hum != 0)]
+        reject(5, (co2 == 0) | (voc == 0) | (tmp == 0) | (hum == 0))
         # Bei Tausenden von Datenpunkten steigt der CO2-Wert stark an, während die anderen Messgrößen einfrieren (z. B. bleibt der VOC-Wert bei einigen Datenpunkten konstant bei 450).
-        invalid_values = (df.CO2 > 20000) & (df.VOC.diff() == 0) & (df.VOC.diff() == 0) & (df.BLE.diff() == 0) & (df.tmp.diff() == 0)
-        df = df[invalid_values == False]
+        rows = np.flatnonzero(reasons == 0)
+        diffs = self.predecessor_diffs(df, rows, ["VOC", "BLE", "tmp"], carry, "frozen")
+        frozen = (co2[rows] > 20000) & (diffs["VOC"] == 0) & (diffs["BLE"] == 0) & (diffs["tmp"] == 0)
+        reasons[rows[frozen]] = 6
+        return reasons
+    
+    @staticmethod
+    def predecessor_diffs(df, rows, columns:list, carry:dict = None, key:str = None):
+        """Differenzen der Spalten zum jeweils vorherigen Datenpunkt unter den ausgewählten Zeilen (wie diff() nach dem Filtern).
+        Im inkrementellen Modus ist der in carry[key] gespeicherte letzte Datenpunkt des vorherigen Laufs der Vorgänger der ersten Zeile;
+        carry[key] wird anschließend auf die letzte ausgewählte Zeile gesetzt.
+        
+        Args:
+            df (pandas.DataFrame): DataFrame Objekt.
+            rows (numpy.ndarray): Positionen der ausgewählten Zeilen.
+            columns (list): Spalten, deren Differenzen berechnet werden.
+            carry (dict): Zustand für den inkrementellen Modus oder None.
+            key (str): Schlüssel des Vorgängers in carry.
+        Returns:
+            diffs (dict): numpy-Array der Differenzen pro Spalte (NaN bzw. NaT für die erste Zeile ohne Vorgänger).
+        """
+        previous = carry.get(key) if carry is not None else None
+        diffs = dict()
+        for col in columns:
+            values = df[col].to_numpy()[rows]
+            if values.dtype.kind not in "fM":
+                # wie Series.diff(): ganzzahlige Spalten ergeben float64-Differenzen
+                values = values.astype(np.float64)
+            if previous is not None:
+                values = np.concatenate([previous[col].to_numpy().astype(values.dtype), values])
+            diff = np.diff(values)
+            if previous is None and rows.size:
+                first = np.array(["NaT"], dtype = diff.dtype) if diff.dtype.kind == "m" else np.array([np.nan], dtype = diff.dtype)
+                diff = np.concatenate([first, diff])
+            diffs[col] = diff
+        if carry is not None and rows.size:
+            carry[key] = df.iloc[rows[-1:]]
+        return diffs
+    
+    def remove_invalid_values(self, df, carry:dict = None):
+        """Entfernt ungültige Datenpunkte aus dem Datensatz. Alle Regeln werden mit validate in einem Durchlauf geprüft und der
+        DataFrame nur einmal gefiltert. Die Anzahl der verworfenen Datenpunkte pro Regel und Raum steht danach in self.validation_report.
+        
+        Args:
+            df (pandas.DataFrame): DataFrame Objekt.
+            carry (dict): Zustand für den inkrementellen Modus (siehe validate).
+        Returns:
+            df (pandas.DataFrame): DataFrame Objekt.
+        """
+        reasons = self.validate(df, carry = carry)
+        self.validation_report = self.validation_statistics(df, reasons)
+        df = df[reasons == 0]
         df.reset_index(drop = True, inplace = True)
         return df
     
+    @staticmethod
+    def validation_statistics(df, reasons):
+        """Zählt die verworfenen Datenpunkte pro Regel und Raum.
+        
+        Args:
+            df (pandas.DataFrame): DataFrame Objekt.
+            reasons (numpy.ndarray): Reason-Codes aus validate.
+        Returns:
+            report (pandas.DataFrame): Anzahl pro Raum (Zeilen) und Regel (Spalten), inklusive der gültigen Datenpunkte ("valid").
+        """
+        labels = ["valid"] + VALIDATION_RULES
+        if "room_number" in df.columns:
+            room_codes, rooms = pd.factorize(df.room_number, sort = True)
+        else:
+            room_codes, rooms = np.zeros(df.shape[0], dtype = np.intp), pd.Index(["all"])
+        counts = np.bincount(room_codes * len(labels) + reasons, minlength = len(rooms) * len(labels))
+        return pd.DataFrame(counts.reshape(len(rooms), len(labels)), index = pd.Index(rooms, name = "room_number"), columns = labels)
+    
     
     def create_rolling_windows(self, df, rolling_window, sample_time = "60min"):
         """Neuabtastung der Daten in einem bestimmten Zeitintervall (sample_time) und Erstellung von Rolling Windows mit der Größe von rolling_window.
@@ -302,79 +1091,139 @@ class DataPreprocessing:
         Returns:
             df (pandas.DataFrame): DataFrame Objekt.
         """
+        numerical_features = ["tmp","hum","CO2","VOC","vis","IR", "BLE", 'rssi', "snr"]
+        # Einmalige Partitionierung nach Raum (in der Reihenfolge des ersten Auftretens) und Zeit statt einer Maske pro Raum.
+        rooms = np.asarray(df.room_number.unique(), dtype = object)
         df_sorted = df.sort_values(self.date_time_column)
-        all_results = list()
-        for room in df.room_number.unique():
-            room_df = df_sorted[df_sorted.room_number == room]
-            numerical_features = ["tmp","hum","CO2","VOC","vis","IR", "BLE", 'rssi', "snr"]
-            room_df = room_df.set_index(self.date_time_column)
-            if self.roll:
-                # Neuabtastung der Datenpunkte (das Abtastintervall sollte kleiner sein als die Größe des rollenden Fensters)
-                room_df_resampled = room_df[numerical_features].resample(sample_time).mean()
-                # berechne die rollierenden Fenster
-                room_df_rolled = room_df_resampled.rolling(rolling_window).mean()
-                # Wiedervereinigung der nicht-numerischen Features mit den numerischen Features in dem DataFrame (Features mit Zeitinformationen werden separat hinzugefügt)
-                non_numerical_df = room_df.select_dtypes(exclude=['number']).resample(sample_time).first()
-                result = room_df_rolled.join(non_numerical_df)
-            else:
-                result = room_df
-            result.loc[:, "room_number"] = room
-            all_results.append(result)
-            
-        # Konkateniere alle DataFrames aus der vorherigen for-Schleife zu einem Objekt.
-        all_results_df = pd.concat([result_df for result_df in all_results if not result_df.empty])
+        room_codes = pd.Categorical(df_sorted.room_number, categories = rooms).codes
+        order = np.argsort(room_codes, kind = "stable")
+        df_sorted, room_codes = df_sorted.iloc[order], room_codes[order]
+        if self.roll:
+            times = df_sorted[self.date_time_column]
+            # Intervallbeginn wie bei DataFrame.resample: Raster ab Mitternacht des ersten Tages eines Raumes
+            origin = times.groupby(room_codes).transform("min").dt.normalize()
+            sample_delta = pd.Timedelta(sample_time)
+            buckets = origin + ((times - origin) // sample_delta) * sample_delta
+            grouped = df_sorted.groupby([room_codes, buckets.to_numpy()], sort = True)
+            # Neuabtastung der Datenpunkte (das Abtastintervall sollte kleiner sein als die Größe des rollenden Fensters).
+            # Leere Intervalle werden nicht erzeugt, da sie ohnehin keine nicht-numerischen Werte hätten und entfernt würden.
+            resampled = grouped[numerical_features].mean()
+            resampled.index.names = ["room_code", self.date_time_column]
+            resampled = resampled.reset_index(level = self.date_time_column)
+            # berechne die rollierenden Fenster aller Räume in einer gruppierten Operation
+            rolled = resampled.groupby(level = "room_code", sort = False).rolling(rolling_window, on = self.date_time_column)[numerical_features].mean()
+            # Wiedervereinigung der nicht-numerischen Features mit den numerischen Features (Features mit Zeitinformationen werden separat hinzugefügt)
+            non_numerical_features = [col for col in df_sorted.select_dtypes(exclude=['number']).columns if col != self.date_time_column]
+            non_numerical_df = grouped[non_numerical_features].first()
+            all_results_df = pd.DataFrame(rolled[numerical_features].to_numpy(), columns = numerical_features,
+                                          index = pd.DatetimeIndex(resampled[self.date_time_column], name = self.date_time_column))
+            for col in non_numerical_features:
+                all_results_df[col] = non_numerical_df[col].to_numpy()
+            all_results_df["room_number"] = rooms[resampled.index.to_numpy()]
+        else:
+            all_results_df = df_sorted.set_index(self.date_time_column)
         # Entferne leere Datenpunkte, die durch das Resampling entstanden sind.
         all_results_df = self.drop_na_rows(all_results_df)
         return all_results_df
     
-    def create_time_diff_features(self, df):
-        """Erstelle Features, die zeitliche Werteänderungen darstellen.
+    def create_temporal_features(self, df, features:list = None, rates:bool = True, fill:bool = True):
+        """Berechnet alle zeitlichen Features in einem nach Raum und Zeit sortierten Durchlauf: den zeitlichen Abstand zum vorherigen
+        Datenpunkt des Raumes (time_diff_sec, wie Series.dt.seconds ohne Tage), die Änderung jedes Features (<feature>_diff) und die
+        Änderungsrate pro Sekunde (<feature>_diff_per_sec). Differenzen werden nie über Raumgrenzen hinweg gebildet.
+        Die Reihenfolge der Zeilen bleibt erhalten.
         
         Args:
             df (pandas.DataFrame): DataFrame Objekt.
+            features (list): Features, deren Änderungen berechnet werden. Standard: self.diff_features.
+            rates (bool): berechnet zusätzlich die Änderungsraten pro Sekunde, wenn True.
+            fill (bool): füllt fehlende Werte anschließend raumweise mit fill_na auf, wenn True.
         Returns:
             df (pandas.DataFrame): DataFrame Objekt.
         """
         if self.date_time_column not in df.columns:
             # Index zurücksetzen, da die Spalte mit den Zeitinformationen benötigt wird.
             df = df.reset_index()
-        df = df.sort_values(by = [self.date_time_column])
-        df["time_diff_sec"] = df.groupby('room_number')[self.date_time_column].diff().dt.seconds
-        # Iteriere über jedes numerische Feature und berechne die zeitliche Werteänderungen
-        for feature in ["tmp"]:
-                df[f"{feature}_diff"] = df.groupby('room_number')[feature].diff()
-        # es entstehen ggf. unendlich große Werte. Ersetze sie durch 0.
-        df = df.replace([np.inf, -np.inf], 0)
+        features = self.diff_features if features is None else features
+        room_codes = pd.factorize(df.room_number)[0]
+        times = df[self.date_time_column].to_numpy()
+        # eine Sortierung für alle Differenzen, der Vorgänger eines Datenpunktes ist der vorherige Datenpunkt desselben Raumes
+        order = np.lexsort((times, room_codes))
+        same_room = room_codes[order][1:] == room_codes[order][:-1]
+        new_columns = dict()
+        time_diff = np.diff(times[order]).astype("m8[ns]").view(np.int64)
+        seconds = np.full(order.size, np.nan)
+        seconds[1:][same_room] = (time_diff[same_room] // 10**9) % 86400
+        new_columns["time_diff_sec"] = seconds
+        for feature in features:
+            values = df[feature].to_numpy()[order]
+            if values.dtype.kind != "f":
+                values = values.astype(np.float64)
+            diff = np.full(order.size, np.nan, dtype = values.dtype)
+            diff[1:][same_room] = (values[1:] - values[:-1])[same_room]
+            new_columns[f"{feature}_diff"] = diff
+            if rates:
+                with np.errstate(divide = "ignore", invalid = "ignore"):
+                    rate = diff / seconds
+                # bei Datenpunkten im Abstand von ganzen Tagen ist time_diff_sec 0. Unendliche Raten werden durch 0 ersetzt.
+                rate[np.isinf(rate)] = 0
+                new_columns[f"{feature}_diff_per_sec"] = rate
+        # zurück in die ursprüngliche Reihenfolge der Zeilen
+        df = df.copy(deep = False)
+        for col, values in new_columns.items():
+            restored = np.empty_like(values)
+            restored[order] = values
+            df[col] = restored
+        if fill:
+            df = self.fill_na(df)
         return df
     
+    def create_time_diff_features(self, df):
+        """Erstelle Features, die zeitliche Werteänderungen darstellen (time_diff_sec und <feature>_diff für self.diff_features).
+        Der DataFrame wird nach der Zeit sortiert zurückgegeben.
+        
+        Args:
+            df (pandas.DataFrame): DataFrame Objekt.
+        Returns:
+            df (pandas.DataFrame): DataFrame Objekt.
+        """
+        df = self.create_temporal_features(df, rates = False, fill = False)
+        return df.sort_values(by = [self.date_time_column], kind = "stable")
+    
     def create_average_differentials(self, df):
-        """Berechne die durchschnittliche Änderungsrate pro Sekunde für CO2, VOC, tmp, hum, IR und vis.
+        """Berechne die durchschnittliche Änderungsrate pro Sekunde für die Features in self.diff_features.
         
         Args:
             df (pandas.DataFrame): DataFrame Objekt.
         Returns:
             df (pandas.DataFrame): DataFrame Objekt."""
-        for feature in ["tmp_diff"]:
-                df[f"{feature}_per_sec"] = df[feature].div(df["time_diff_sec"])
-        df = df.replace([np.inf, -np.inf], 0)
+        for feature in self.diff_features:
+            rate = df[f"{feature}_diff"].div(df["time_diff_sec"])
+            # es entstehen ggf. unendlich große Werte. Ersetze sie durch 0.
+            df[f"{feature}_diff_per_sec"] = rate.mask(np.isinf(rate), 0)
         return df
     
     def fill_na(self, df):
-        """Fülle fehlende Werte im DataFrame auf.
+        """Fülle fehlende Werte im DataFrame auf. Differenzen (Spalten mit "_diff") werden mit 0 gefüllt, alle anderen Spalten
+        zuerst rückwärts und dann vorwärts, jeweils nur innerhalb eines Raumes.
         
         Args:
             df (pandas.DataFrame): DataFrame Objekt.
         Returns:
             df (pandas.DataFrame): DataFrame Objekt.
         """
-        for col in df.columns:
-            is_na = df[col].isna().any()
-            if is_na:
-                if "_diff" in col:
-                    df[col] = df[col].fillna(0)
-                else:
-                    df[col] = df[col].fillna(method = "bfill")
-                    df[col] = df[col].fillna(method = "ffill")
+        missing = [col for col in df.columns if df[col].isna().any()]
+        diff_columns = [col for col in missing if "_diff" in col]
+        other_columns = [col for col in missing if "_diff" not in col]
+        for col in diff_columns:
+            df[col] = df[col].fillna(0)
+        if other_columns:
+            if "room_number" in df.columns:
+                rooms = pd.factorize(df.room_number)[0]
+                filled = df[other_columns].groupby(rooms, sort = False).bfill()
+                filled = filled.groupby(rooms, sort = False).ffill()
+            else:
+                filled = df[other_columns].bfill().ffill()
+            df[other_columns] = filled
         return df
     
     def create_new_features(self, df):
@@ -397,4 +1246,28 @@ class DataPreprocessing:
         df.loc[(df.CO2 >= 1200) & (df.CO2 < 1600), "color"] = "red"
         df.loc[(df.CO2 >= 1600), "color"] = "red_blinking"
         # Einige Räume haben unterschiedliche Verhältnisse zwischen VOC und CO2.
-        return df
\ No newline at end of file
+        # Kompakte Datentypen für Kalenderfelder und die Ampelfarbe (siehe schema.py)
+        return apply_schema(df)
+
+
+def available_cpus():
+    """Anzahl der CPU-Kerne, auf denen dieser Prozess laufen darf."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def preprocess_room_shard(config:dict, df, rolling_window:str, sample_time:str = "60min"):
+    """Worker von DataPreprocessing.preprocess_rooms_parallel: führt preprocess_rooms für eine Gruppe von Räumen mit einem schlanken
+    DataPreprocessing-Objekt aus, das nur aus der Konfiguration erstellt wird.
+    
+    Args
+        config (dict): Argumente für DataPreprocessing (get_outliers_out, roll, date_time_column, diff_features).
+        df (pandas.DataFrame): die bereinigten Daten der Räume.
+        rolling_window (str): die Größe des rollenden Fensters (z.B. '1s', '1min', '1h').
+        sample_time (str): die Größe, die für das Resampling verwendet wird.
+    Rückgabe
+        df (pandas.DataFrame): DataFrame Objekt.
+    """
+    return DataPreprocessing(**config).preprocess_rooms(df, rolling_window = rolling_window, sample_time = sample_time)
+
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    resource = None
+from datetime import datetime
+import pandas as pd
+
+
+class StepProfiler:
+    """
+    Opt-in instrumentation for the steps of DataPreprocessing.preprocess_df and FeatureEngineering.feature_engineering.
+    Records wall time, rows in/out and the memory delta per step. Memory is read from the resident set size of the process
+    before and after the step, outside the timed region, so the wall times are not affected by the measurement.
+    """
+    def __init__(self, label:str = "pipeline", trace_memory:bool = False):
+        """
+        Parameters:
+        label (str): Name of the profiled run, stored with every record.
+        trace_memory (bool): Measure the Python allocations of each step with tracemalloc instead of the resident set size.
+                             More precise, but tracing slows down allocation-heavy steps considerably (several times for
+                             e.g. remove_outliers), so the wall times are inflated. Use it only to investigate memory.
+        """
+        self.label = label
+        self.trace_memory = trace_memory
+        self.records = []
+        self._started_tracing = False
+
+    def run(self, name:str, func, *args, frame = None, **kwargs):
+        """
+        Run one pipeline step and record its metrics.
+
+        Parameters:
+        name (str): Name of the step.
+        func (callable): The step to run.
+        *args: Positional arguments of the step. If the first one is a DataFrame, it is counted as the input rows.
+        frame (callable): Returns the DataFrame the step works on. Used to count rows in and out for steps
+                          that modify an attribute (e.g. FeatureEngineering.df) instead of taking and returning a frame.
+        **kwargs: Keyword arguments of the step.
+
+        Returns:
+        The return value of the step.
+        """
+        rows_in = None
+        if frame is not None:
+            rows_in = frame().shape[0]
+        elif args and isinstance(args[0], pd.DataFrame):
+            rows_in = args[0].shape[0]
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            memory_before, _ = tracemalloc.get_traced_memory()
+        else:
+            memory_before, peak_before = resident_memory(), peak_resident_memory()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        wall_time = time.perf_counter() - start
+        rows_out = None
+        if frame is not None:
+            rows_out = frame().shape[0]
+        elif isinstance(result, pd.DataFrame):
+            rows_out = result.shape[0]
+        record = {
+            "run": self.label,
+            "step": name,
+            "wall_s": wall_time,
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "memory_delta_mb": None,
+            "memory_peak_mb": None,
+        }
+        if self.trace_memory:
+            memory_after, memory_peak = tracemalloc.get_traced_memory()
+            record["memory_delta_mb"] = (memory_after - memory_before) / 1024**2
+            record["memory_peak_mb"] = (memory_peak - memory_before) / 1024**2
+        else:
+            memory_after, peak_after = resident_memory(), peak_resident_memory()
+            if memory_before is not None and memory_after is not None:
+                record["memory_delta_mb"] = (memory_after - memory_before) / 1024**2
+            if peak_before is not None and peak_after is not None:
+                # growth of the peak resident set size of the process, 0 if the step stayed below an earlier peak
+                record["memory_peak_mb"] = (peak_after - memory_before) / 1024**2 if peak_after > peak_before else 0.0
+        self.records.append(record)
+        return result
+
+    def stop(self):
+        """
+        Stop tracing memory allocations if this profiler started it.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self):
+        """
+        Return the recorded metrics.
+
+        Returns:
+        pd.DataFrame: One row per executed step.
+        """
+        return pd.DataFrame(self.records, columns=["run", "step", "wall_s", "rows_in", "rows_out", "memory_delta_mb", "memory_peak_mb"])
+
+    def print_report(self):
+        """
+        Print the recorded metrics as a table, including the share of each step in the total wall time.
+        """
+        report = self.report()
+        if report.empty:
+            print("No steps recorded.")
+            return
+        report["share"] = report.wall_s / report.wall_s.sum()
+        print(report.drop(columns=["run"]).to_string(index=False, float_format="{:.3f}".format))
+        print(f"Total: {report.wall_s.sum():.3f} s in {report.shape[0]} steps.")
+
+    def save(self, path:str):
+        """
+        Save the recorded metrics as JSON (with a timestamp, for comparisons between nightly runs) or as CSV,
+        depending on the file extension.
+
+        Parameters:
+        path (str): Path of the report file (.json or .csv).
+        """
+        report = self.report()
+        if path.endswith(".csv"):
+            report.to_csv(path, index=False)
+            return
+        with open(path, "w") as file:
+            json.dump({"run": self.label, "created": datetime.now().isoformat(timespec="seconds"),
+                       "steps": json.loads(report.to_json(orient="records"))}, file, indent=2)
+
+
+def run_step(profiler, func, *args, frame = None, **kwargs):
+    """
+    Run a pipeline step through the profiler, or call it directly when profiling is off.
+    """
+    if profiler is None:
+        return func(*args, **kwargs)
+    return profiler.run(func.__name__, func, *args, frame=frame, **kwargs)
+
+
+def resident_memory():
+    """
+    Current resident set size of the process in bytes (Linux), None where it is not available.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_resident_memory():
+    """
+    Peak resident set size of the process in bytes, None where the resource module is not available (Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
@@ -0,0 +1,90 @@
+import pandas as pd
+
+# Mapping of room prefixes (room number without digits) to the building
+BUILDING_NAMES = {"ama":"am","amb":"am",
+                  "ba":"b", "bb":"b",
+                  "eu":"e",
+                  "fa":"f","fu":"f",
+                  "lia":"li","lib":"li","lie":"li","liu":"li",
+                  "mu":"m"}
+
+# Sensor readings of the CO2-Ampeln and features derived from them
+SENSOR_DTYPES = {"CO2": "float32", "VOC": "float32", "tmp": "float32", "hum": "float32",
+                 "vis": "float32", "IR": "float32", "BLE": "float32", "WIFI": "float32",
+                 "rssi": "float32", "snr": "float32"}
+DERIVED_DTYPES = {"anomaly_score": "float32", "time_diff_sec": "float32",
+                  "hour_sin": "float32", "hour_cos": "float32", "day_of_week_sin": "float32", "day_of_week_cos": "float32",
+                  "month_sin": "float32", "month_cos": "float32"}
+CALENDAR_DTYPES = {"year": "int16", "month": "int8", "dayofweek": "int8", "hour": "int8"}
+# Categories with a fixed order, room and building categories are taken from the data
+COLOR_CATEGORIES = ["green", "yellow", "red", "red_blinking"]
+SEASON_CATEGORIES = ["winter", "spring", "summer", "autumn"]
+CATEGORICAL_DTYPES = {"room_number": "category", "building_name": "category",
+                      "color": pd.CategoricalDtype(COLOR_CATEGORIES),
+                      "season": pd.CategoricalDtype(SEASON_CATEGORIES)}
+
+DTYPE_SCHEMA = {**SENSOR_DTYPES, **DERIVED_DTYPES, **CALENDAR_DTYPES, **CATEGORICAL_DTYPES}
+# Column suffixes of the differences of the configured diff features (e.g. tmp_diff, CO2_diff_per_sec)
+SUFFIX_DTYPES = {"_diff": "float32", "_diff_per_sec": "float32"}
+
+
+def schema_dtypes(columns):
+    """
+    Schema dtypes of the given columns: the columns of DTYPE_SCHEMA and the columns ending with a suffix of SUFFIX_DTYPES.
+    """
+    dtypes = {col: dtype for col in columns for suffix, dtype in SUFFIX_DTYPES.items() if str(col).endswith(suffix)}
+    dtypes.update({col: dtype for col, dtype in DTYPE_SCHEMA.items() if col in columns})
+    return dtypes
+
+
+def memory_footprint(df):
+    """
+    Memory usage of a DataFrame in bytes, including the contents of object columns.
+    """
+    return int(df.memory_usage(deep=True).sum())
+
+
+def print_memory_report(before:int, after:int, label:str = "DataFrame"):
+    """
+    Print the memory footprint of a DataFrame before and after a dtype conversion.
+
+    Parameters:
+    before (int): Memory usage in bytes before the conversion.
+    after (int): Memory usage in bytes after the conversion.
+    label (str): Name of the frame in the report.
+    """
+    change = (after - before) / before * 100 if before else 0.0
+    print(f"{label} memory footprint: {before / 1024**2:.2f} MB -> {after / 1024**2:.2f} MB ({change:+.1f}%)")
+
+
+def apply_schema(df, inplace:bool = False, verbose:bool = False, label:str = "DataFrame"):
+    """
+    Cast all columns of a DataFrame that are part of DTYPE_SCHEMA or end with a suffix of SUFFIX_DTYPES to their compact dtype:
+    float32 for sensor readings and derived features, small integers for calendar fields
+    and categoricals for room, building, color and season. Columns that are not in the schema are left unchanged.
+
+    Parameters:
+    df (pd.DataFrame): The input DataFrame.
+    inplace (bool): Convert the columns of df itself instead of a copy.
+    verbose (bool): Print the memory footprint before and after the conversion.
+    label (str): Name of the frame in the memory report.
+
+    Returns:
+    pd.DataFrame: DataFrame with compact dtypes.
+    """
+    before = memory_footprint(df) if verbose else None
+    if not inplace:
+        df = df.copy(deep=False)
+    for col, dtype in schema_dtypes(df.columns).items():
+        if df[col].dtype == dtype:
+            continue
+        if dtype in CALENDAR_DTYPES.values() and df[col].isna().any():
+            # small integer types cannot hold missing values
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (ValueError, TypeError) as e:
+            print(f"Could not convert {col} to {dtype}: {e}")
+    if verbose:
+        print_memory_report(before, memory_footprint(df), label)
+    return df
@@ -0,0 +1,194 @@
+import io
+import os
+import tarfile
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Column order of the .dat files of the CO2-Ampeln
+DAT_COLUMNS = ["device_id", "date_time", "CO2", "VOC", "tmp", "hum", "vis", "IR", "BLE", "WIFI", "rssi", "snr",
+               "gateway", "f_cnt", "spreading_factor", "bandwidth", "channel_rssi", "channel_index"]
+FLOORS = ["u", "0", "1", "2", "3"]
+
+
+def room_names(n_rooms:int, building:str = "e"):
+    """
+    Room numbers in the naming scheme of the buildings (e.g. eu01, e001, e104), spread over the floors.
+
+    Parameters:
+    n_rooms (int): Number of rooms.
+    building (str): Building prefix.
+
+    Returns:
+    list: Room numbers.
+    """
+    per_floor = -(-n_rooms // len(FLOORS))
+    width = max(2, len(str(per_floor)))
+    rooms = [f"{building}{floor}{room:0{width}d}" for room in range(1, per_floor + 1) for floor in FLOORS]
+    return sorted(rooms[:n_rooms])
+
+
+def generate_room(room:str, times, rng, gap_rate:float = 0.0005, max_gap:str = "6h", outlier_rate:float = 0.001):
+    """
+    Generate the readings of one CO2-Ampel: daily and seasonal temperature cycles, occupancy on weekdays
+    (rising CO2, VOC, IR, BLE and WIFI), daylight for vis, transmission gaps and injected outliers.
+
+    Parameters:
+    room (str): Room number, the device id is 'hka-aqm-<room>'.
+    times (pd.DatetimeIndex): Regular sampling times.
+    rng (np.random.Generator): Random generator.
+    gap_rate (float): Probability per reading that a transmission gap starts.
+    max_gap (str): Maximum length of a gap.
+    outlier_rate (float): Share of readings with an outlier in one of CO2, tmp, vis, hum or VOC.
+
+    Returns:
+    pd.DataFrame: Readings in the column layout of the .dat files, with an 'is_outlier' column.
+    """
+    n = len(times)
+    hour = times.hour.to_numpy() + times.minute.to_numpy() / 60
+    day_of_year = times.dayofyear.to_numpy()
+    # Occupancy per hour block on working days between 8 and 18 o'clock
+    hour_block = ((times - times[0]) // pd.Timedelta("1h")).to_numpy() if n else np.zeros(0, dtype=int)
+    occupied_blocks = rng.random(hour_block.max() + 1 if n else 0) < 0.6
+    occupancy = (occupied_blocks[hour_block] & (times.dayofweek.to_numpy() < 5) & (hour >= 8) & (hour < 18)).astype(float)
+    smoothed_occupancy = pd.Series(occupancy).rolling(6, min_periods=1).mean().to_numpy()
+
+    seasonal = -np.cos(2 * np.pi * (day_of_year - 15) / 365)
+    daily = -np.cos(2 * np.pi * (hour - 3) / 24)
+    drift = np.cumsum(rng.normal(0, 0.02, n))
+    drift -= pd.Series(drift).rolling(288, min_periods=1).mean().to_numpy()
+    tmp = 21 + rng.normal(0, 1) + 2.5 * seasonal + 0.8 * daily + 1.2 * smoothed_occupancy + drift + rng.normal(0, 0.05, n)
+    hum = np.clip(45 - 1.5 * (tmp - 21) + 8 * seasonal + rng.normal(0, 1, n), 15, 85)
+    co2 = 420 + rng.uniform(300, 900) * smoothed_occupancy + rng.normal(0, 15, n)
+    voc = 100 + 0.4 * (co2 - 420) + rng.normal(0, 10, n)
+    daylight = np.clip(np.sin(np.pi * (hour - 6) / 14), 0, None)
+    vis = 250 * daylight + 150 * occupancy + rng.normal(0, 5, n)
+    ir = rng.poisson(1 + 20 * occupancy)
+    ble = rng.poisson(0.5 + 6 * occupancy)
+    wifi = rng.poisson(0.5 + 8 * occupancy)
+
+    df = pd.DataFrame({
+        "device_id": f"hka-aqm-{room}",
+        "date_time": times + pd.to_timedelta(rng.integers(0, 30, n), unit="s"),
+        "CO2": np.round(co2),
+        "VOC": np.round(np.clip(voc, 0, None)),
+        "tmp": np.round(tmp, 2),
+        "hum": np.round(hum, 1),
+        "vis": np.round(np.clip(vis, 0, None)),
+        "IR": ir,
+        "BLE": ble,
+        "WIFI": wifi,
+        "rssi": rng.integers(-115, -60, n),
+        "snr": np.round(rng.normal(5, 3, n), 1),
+        "gateway": rng.choice(["hka-gw-01", "hka-gw-02"], n),
+        "f_cnt": np.arange(n),
+        "spreading_factor": rng.choice([7, 8, 9], n),
+        "bandwidth": 125,
+        "channel_rssi": rng.integers(-115, -60, n),
+        "channel_index": rng.integers(0, 8, n),
+    })
+
+    is_outlier = rng.random(n) < outlier_rate
+    outlier_rows = np.flatnonzero(is_outlier)
+    outlier_features = rng.choice(["CO2", "tmp", "vis", "hum", "VOC"], outlier_rows.size)
+    for col, low, high in (("CO2", 5000, 40000), ("tmp", 45, 85), ("vis", 5000, 60000), ("hum", 0, 5), ("VOC", 5000, 60000)):
+        rows = outlier_rows[outlier_features == col]
+        df.loc[rows, col] = np.round(rng.uniform(low, high, rows.size), 2)
+    df["is_outlier"] = is_outlier
+
+    # Transmission gaps: runs of missing readings that start with probability gap_rate
+    gap_length = max(1, int(pd.Timedelta(max_gap) / (times[1] - times[0]))) if n > 1 else 1
+    starts = np.flatnonzero(rng.random(n) < gap_rate)
+    in_gap = np.zeros(n + 1, dtype=int)
+    np.add.at(in_gap, starts, 1)
+    np.add.at(in_gap, np.minimum(starts + rng.integers(1, gap_length + 1, starts.size), n), -1)
+    return df[np.cumsum(in_gap[:n]) == 0].reset_index(drop=True)
+
+
+def dat_file_content(df, bad_line_rate:float = 0.0, rng = None):
+    """
+    Render readings as the content of a .dat file: a title line, the ';'-delimited header and the rows.
+    With bad_line_rate > 0, rows with too many fields are inserted (skipped by DataExtractor).
+    """
+    lines = df[DAT_COLUMNS].to_csv(sep=";", index=False, date_format="%Y-%m-%d %H:%M:%S").splitlines()
+    if bad_line_rate > 0 and len(lines) > 1:
+        rng = rng if rng is not None else np.random.default_rng()
+        for position in sorted(np.flatnonzero(rng.random(len(lines) - 1) < bad_line_rate) + 1, reverse=True):
+            lines.insert(position, lines[position] + ";" * 5 + "corrupt")
+    return f"{df.device_id.iloc[0]};CO2-Ampel\n" + "\n".join(lines) + "\n"
+
+
+def write_dataset(directory:str, n_rooms:int = 10, months:int = 1, start:str = "2022-06-01", freq:str = "5min",
+                  gap_rate:float = 0.0005, max_gap:str = "6h", outlier_rate:float = 0.001, bad_line_rate:float = 0.0,
+                  archive:str = None, seed:int = 0):
+    """
+    Write a synthetic CO2-Ampel dataset as .dat files (one file per device and day in a folder per device),
+    optionally packed into one archive per month.
+
+    Parameters:
+    directory (str): Output directory.
+    n_rooms (int): Number of rooms.
+    months (int): Number of months of readings.
+    start (str): First day of the readings.
+    freq (str): Sampling interval of the sensors.
+    gap_rate (float): Probability per reading that a transmission gap starts.
+    max_gap (str): Maximum length of a gap.
+    outlier_rate (float): Share of readings with an injected outlier.
+    bad_line_rate (float): Share of malformed lines in the files.
+    archive (str): None for plain .dat files, "zip" or "tar" for one .zip or .tar.gz per month.
+    seed (int): Seed of the random generator.
+
+    Returns:
+    dict: Number of rooms, files, rows and injected outliers.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    times = pd.date_range(start, pd.Timestamp(start) + pd.DateOffset(months=months), freq=freq, inclusive="left")
+    archives = {}
+    summary = {"rooms": n_rooms, "files": 0, "rows": 0, "outliers": 0}
+    try:
+        for room in room_names(n_rooms):
+            df = generate_room(room, times, rng, gap_rate=gap_rate, max_gap=max_gap, outlier_rate=outlier_rate)
+            summary["rows"] += df.shape[0]
+            summary["outliers"] += int(df.is_outlier.sum())
+            device = df.device_id.iloc[0] if not df.empty else f"hka-aqm-{room}"
+            for day, day_df in df.groupby(df.date_time.dt.date):
+                name = f"{device}/{device}_{day}.dat"
+                content = dat_file_content(day_df, bad_line_rate, rng)
+                summary["files"] += 1
+                if archive is None:
+                    os.makedirs(os.path.join(directory, device), exist_ok=True)
+                    with open(os.path.join(directory, name), "w") as file:
+                        file.write(content)
+                    continue
+                month = str(day)[:7]
+                if month not in archives:
+                    archives[month] = open_archive(os.path.join(directory, f"hka-aqm_{month}"), archive)
+                add_to_archive(archives[month], name, content.encode())
+    finally:
+        for handle in archives.values():
+            handle.close()
+    return summary
+
+
+def open_archive(path:str, archive:str):
+    """
+    Open a .zip or .tar.gz archive for writing.
+    """
+    if archive == "zip":
+        return zipfile.ZipFile(path + ".zip", "w", compression=zipfile.ZIP_DEFLATED)
+    if archive == "tar":
+        return tarfile.open(path + ".tar.gz", "w:gz")
+    raise ValueError(f"Unknown archive type: {archive}")
+
+
+def add_to_archive(handle, name:str, data:bytes):
+    """
+    Add a file to an open .zip or tar archive.
+    """
+    if isinstance(handle, zipfile.ZipFile):
+        handle.writestr(name, data)
+        return
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    handle.addfile(info, io.BytesIO(data))
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+from forecast import MODEL_VARIANTS, SlidingWindowDataset, BiLSTMForecaster
+from partition_index import building_of
+
+METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT, job TEXT, started TEXT, finished TEXT, config TEXT,
+    epochs INTEGER, best_epoch INTEGER, best_test_loss REAL, stopped_early INTEGER, checkpoint TEXT,
+    PRIMARY KEY (run_id, job)
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    run_id TEXT, job TEXT, epoch INTEGER, train_loss REAL, test_loss REAL, wall_s REAL, samples_per_s REAL,
+    PRIMARY KEY (run_id, job, epoch)
+);
+"""
+
+
+def connect_metrics(path:str):
+    """
+    Open the SQLite metrics store and create its tables. Workers write concurrently, so locks are waited for.
+    """
+    connection = sqlite3.connect(path, timeout=60)
+    connection.executescript(METRICS_SCHEMA)
+    return connection
+
+
+def dataset_columns(features, target:str):
+    """
+    Columns of the saved training array: the model inputs, followed by the target if it is no input.
+    """
+    return list(features) if target in features else list(features) + [target]
+
+
+def prepare_jobs(df, feature_columns:dict, directory:str, target:str = "tmp", lag:int = 1, per_building:bool = False):
+    """
+    Save the training data of every model variant (and optionally of every building) as memory-mapped dataset,
+    so the workers read it from disk instead of receiving a copy of the frame.
+
+    Parameters:
+    df (pd.DataFrame): Output of FeatureEngineering.feature_engineering, hourly rows per room.
+    feature_columns (dict): Input columns per variant (checkpoint number or name), in model order.
+    directory (str): Directory of the .npy files.
+    target (str): Column that is forecast, its value in the row after a window is the label.
+                  If it is no model input, it is stored as last column of the array.
+    lag (int): Number of time steps per window (1 if the lags are columns).
+    per_building (bool): Add one job per variant and building.
+
+    Returns:
+    list: Job descriptions for train_jobs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    groups = {None: df}
+    if per_building:
+        buildings = df["room_number"].astype(str).map(building_of)
+        groups.update({building: df[buildings == building] for building in buildings.unique()})
+    jobs = []
+    for variant, columns in feature_columns.items():
+        name = MODEL_VARIANTS.get(variant, variant)
+        for building, group in groups.items():
+            job = str(variant) if building is None else f"{variant}_{building}"
+            path = os.path.join(directory, f"{job}.npy")
+            SlidingWindowDataset.from_frame(group, dataset_columns(columns, target), target=target, lag=lag, path=path)
+            jobs.append({"job": job, "variant": name, "building": building, "path": path,
+                         "features": list(columns), "target": target, "lag": lag})
+    return jobs
+
+
+def train_job(job:dict, run_id:str, output_directory:str, metrics_path:str, epochs:int = 30, patience:int = 5,
+              min_delta:float = 0.0, batch_size:int = 256, learning_rate:float = 1e-3, test_share:float = 0.2,
+              threads:int = 1, seed:int = 0):
+    """
+    Train one BiLSTM with early stopping. The best model is checkpointed as state dict after every improvement,
+    the losses are written as <job>_losses.txt in the format of trained_models and every epoch is logged to the metrics store.
+
+    Parameters:
+    job (dict): Job from prepare_jobs.
+    run_id (str): Id of the training run.
+    output_directory (str): Directory of the checkpoints.
+    metrics_path (str): SQLite metrics store.
+    epochs (int): Maximum number of epochs.
+    patience (int): Epochs without improvement of the test loss before stopping.
+    min_delta (float): Smallest decrease of the test loss that counts as improvement.
+    batch_size (int): Windows per batch.
+    learning_rate (float): Learning rate of Adam.
+    test_share (float): Share of the windows of every room used for testing.
+    threads (int): torch threads of the worker.
+    seed (int): Seed of the initialization and the batch order.
+
+    Returns:
+    dict: Summary of the job.
+    """
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    dataset = SlidingWindowDataset.load(job["path"], dataset_columns(job["features"], job["target"]), target=job["target"], lag=job["lag"])
+    n_features = len(job["features"])
+    train_indices, test_indices = dataset.split(test_share)
+    model = BiLSTMForecaster(n_features)
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+    criterion = nn.MSELoss()
+    checkpoint = os.path.join(output_directory, f"{job['job']}_lstm_model.pth")
+
+    connection = connect_metrics(metrics_path)
+    started = datetime.now().isoformat(timespec="seconds")
+    train_losses, test_losses = [], []
+    best_loss, best_epoch = np.inf, 0
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        model.train()
+        total = 0.0
+        for x, y in dataset.batches(batch_size, shuffle=True, seed=seed + epoch, indices=train_indices):
+            optimizer.zero_grad()
+            # a target that is no input is stored as last column, the model sees only the features
+            loss = criterion(model(x[:, :, :n_features]), y)
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(x)
+        train_losses.append(total / max(len(train_indices), 1))
+
+        model.eval()
+        total = 0.0
+        with torch.inference_mode():
+            for x, y in dataset.batches(4096, indices=test_indices):
+                total += criterion(model(x[:, :, :n_features]), y).item() * len(x)
+        test_losses.append(total / max(len(test_indices), 1))
+        wall_time = time.perf_counter() - start
+
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO epochs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (run_id, job["job"], epoch, train_losses[-1], test_losses[-1], wall_time, len(train_indices) / wall_time))
+        if test_losses[-1] < best_loss - min_delta:
+            best_loss, best_epoch = test_losses[-1], epoch
+            torch.save(model.state_dict(), checkpoint)
+        elif epoch - best_epoch >= patience:
+            break
+
+    with open(os.path.join(output_directory, f"{job['job']}_losses.txt"), "w") as file:
+        file.write("Train Losses:\n" + "\n".join(map(str, train_losses)) + "\n\nTest Losses:\n" + "\n".join(map(str, test_losses)) + "\n")
+    config = {key: value for key, value in job.items() if key != "features"}
+    config.update(n_features=n_features, epochs=epochs, patience=patience, min_delta=min_delta, batch_size=batch_size,
+                  learning_rate=learning_rate, test_share=test_share, seed=seed)
+    summary = {"run_id": run_id, "job": job["job"], "started": started, "finished": datetime.now().isoformat(timespec="seconds"),
+               "config": json.dumps(config), "epochs": len(train_losses), "best_epoch": best_epoch, "best_test_loss": best_loss,
+               "stopped_early": int(len(train_losses) < epochs), "checkpoint": checkpoint}
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO runs VALUES (:run_id, :job, :started, :finished, :config, :epochs, :best_epoch, "
+                           ":best_test_loss, :stopped_early, :checkpoint)", summary)
+    connection.close()
+    return summary
+
+
+def train_jobs(jobs:list, output_directory:str, metrics_path:str = "training_metrics.sqlite", n_jobs:int = None,
+               threads_per_job:int = 1, run_id:str = None, **kwargs):
+    """
+    Train several jobs in parallel worker processes.
+
+    Parameters:
+    jobs (list): Jobs from prepare_jobs.
+    output_directory (str): Directory of the checkpoints and loss files.
+    metrics_path (str): SQLite metrics store.
+    n_jobs (int): Number of worker processes, -1 for all cores divided by threads_per_job, None or 1 trains in this process.
+    threads_per_job (int): torch threads per worker.
+    run_id (str): Id of the run, default the start time.
+    **kwargs: Training parameters of train_job (epochs, patience, batch_size, ...).
+
+    Returns:
+    pd.DataFrame: Summary per job.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    run_id = run_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+    connect_metrics(metrics_path).close()
+    arguments = dict(run_id=run_id, output_directory=output_directory, metrics_path=metrics_path, threads=threads_per_job, **kwargs)
+    if n_jobs in (None, 1):
+        summaries = [train_job(job, **arguments) for job in jobs]
+    else:
+        max_workers = max(1, (os.cpu_count() or 1) // threads_per_job) if n_jobs == -1 else n_jobs
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(train_job, job, **arguments) for job in jobs]
+            summaries = []
+            for future in as_completed(futures):
+                summaries.append(future.result())
+                print(f"{summaries[-1]['job']}: best test loss {summaries[-1]['best_test_loss']:.4f} "
+                      f"in epoch {summaries[-1]['best_epoch']} of {summaries[-1]['epochs']}")
+    return pd.DataFrame(summaries).drop(columns=["config"])
+
+
+def load_metrics(metrics_path:str, run_id:str = None):
+    """
+    Per-epoch metrics of one or all runs.
+    """
+    query = "SELECT * FROM epochs" + (" WHERE run_id = ?" if run_id else "") + " ORDER BY run_id, job, epoch"
+    with sqlite3.connect(metrics_path) as connection:
+        return pd.read_sql_query(query, connection, params=(run_id,) if run_id else None)
+
+
+def compare_runs(metrics_path:str, jobs = None):
+    """
+    Best test loss, epochs and throughput of every job across runs.
+
+    Parameters:
+    metrics_path (str): SQLite metrics store.
+    jobs (list): Restrict to these jobs.
+
+    Returns:
+    pd.DataFrame: One row per run and job.
+    """
+    query = """
+        SELECT r.run_id, r.job, r.best_test_loss, r.best_epoch, r.epochs, r.stopped_early,
+               SUM(e.wall_s) AS wall_s, AVG(e.samples_per_s) AS samples_per_s
+        FROM runs r JOIN epochs e ON e.run_id = r.run_id AND e.job = r.job
+        GROUP BY r.run_id, r.job ORDER BY r.job, r.run_id
+    """
+    with sqlite3.connect(metrics_path) as connection:
+        result = pd.read_sql_query(query, connection)
+    return result if jobs is None else result[result.job.isin([str(job) for job in jobs])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the BiLSTM variants in parallel with early stopping.")
+    parser.add_argument("data", help="Feature data (.parquet or .pkl) from FeatureEngineering.feature_engineering.")
+    parser.add_argument("features", help="JSON file with the input columns per variant, e.g. {\"0\": [...], \"1\": [...]}.")
+    parser.add_argument("--output", default="trained_models_runs")
+    parser.add_argument("--metrics", default="training_metrics.sqlite")
+    parser.add_argument("--target", default="tmp")
+    parser.add_argument("--per-building", action="store_true")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    data = pd.read_parquet(args.data) if args.data.endswith(".parquet") else pd.read_pickle(args.data)
+    with open(args.features) as file:
+        feature_columns = {int(key) if key.isdigit() else key: columns for key, columns in json.load(file).items()}
+    jobs = prepare_jobs(data, feature_columns, os.path.join(args.output, "data"),
+                        target=args.target, per_building=args.per_building)
+    summary = train_jobs(jobs, args.output, args.metrics, n_jobs=args.n_jobs, threads_per_job=args.threads,
+                         epochs=args.epochs, patience=args.patience, batch_size=args.batch_size)
+    print(summary.to_string(index=False))
+    print(compare_runs(args.metrics).to_string(index=False))